@@ -3,4 +3,41 @@ python.version = python3
 base_url = <value>
 api_token = <value>
 assessment_archival_state = <value>
-test_mode = <value>
\ No newline at end of file
+test_mode = <value>
+test_sample_size = <value>
+test_sample_strategy = <value>
+details_field_spec = <value>
+field_projection = <value>
+qna_event_mode = <value>
+output_buffer_bytes = <value>
+output_flush_interval = <value>
+hec_url = <value>
+hec_token = <value>
+hec_batch_size = <value>
+hec_use_ack = <value>
+hec_ack_timeout = <value>
+hec_verify_ssl = <value>
+max_workers = <value>
+incremental_mode = <value>
+resume_interrupted_runs = <value>
+max_run_seconds = <value>
+collect_run_metrics = <value>
+profile_mode = <value>
+profile_top_n = <value>
+export_order = <value>
+export_boosts = <value>
+export_cache_max_bytes = <value>
+pipeline_mode = <value>
+pipeline_queue_size = <value>
+page_workers = <value>
+stream_summary_pages = <value>
+http_pool_connections = <value>
+http_pool_maxsize = <value>
+http_connect_timeout = <value>
+http_read_timeout = <value>
+max_calls_per_sec = <value>
+list_retry_attempts = <value>
+export_retry_attempts = <value>
+retry_base_delay = <value>
+retry_max_delay = <value>
+retry_jitter = <value>
\ No newline at end of file
@@ -1,16 +1,1134 @@
 import json
+import os
 import sys
 import requests
+from requests.adapters import HTTPAdapter
 import socket
 import re
 import time
+import collections
+import concurrent.futures
+import queue
+import threading
+import email.utils
+import random
+import gzip
+import hashlib
+import importlib
+import codecs
+import uuid
+import itertools
+import array
+import cProfile
+import pstats
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
 from splunklib.modularinput import *
-import splunklib.client as client
+
+def bounded_ordered_map(_executor, _fn, _items, _window):
+
+    # Keep at most _window calls in flight and yield (item, result) pairs in the order of _items
+    in_flight = collections.deque()
+    for item in _items:
+        in_flight.append((item, _executor.submit(_fn, item)))
+        if len(in_flight) >= _window:
+            done_item, done_future = in_flight.popleft()
+            yield done_item, done_future.result()
+    while in_flight:
+        done_item, done_future = in_flight.popleft()
+        yield done_item, done_future.result()
+
+def metered_chunks(_chunks, _meter):
+
+    # Adds the time spent waiting for each chunk and its size to _meter, a [seconds, bytes] pair
+    chunks = iter(_chunks)
+    while True:
+        waitStart = time.perf_counter()
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            return
+        _meter[0] += time.perf_counter() - waitStart
+        _meter[1] += len(chunk)
+        yield chunk
+
+class JsonArrayStream(object):
+
+    # Incremental decoder for a JSON object read in chunks. The items of one array member are yielded
+    # one at a time, so that only the current item needs to be held in memory. Other members are
+    # decoded whole.
+    WHITESPACE = " \t\r\n"
+    DELIMITERS = ",]}" + WHITESPACE
+
+    def __init__(self, _chunks):
+        self.chunks = iter(_chunks)
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def read_more(self):
+        if self.eof:
+            raise ValueError("Unexpected end of JSON document")
+        # Drop the part of the buffer that has already been decoded
+        self.buf = self.buf[self.pos:]
+        self.pos = 0
+        try:
+            self.buf += self.text_decoder.decode(next(self.chunks))
+        except StopIteration:
+            self.buf += self.text_decoder.decode(b"", final=True)
+            self.eof = True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in self.WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            self.read_more()
+
+    def expect(self, _char):
+        if self.peek() != _char:
+            raise ValueError(f"Expecting '{_char}' in JSON document, found '{self.buf[self.pos]}'")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # Strings, objects and arrays end with their closing character. A number or literal is
+                # only complete once a delimiter follows it, as "1" may be the start of "1.5" or "1e5"
+                if self.eof or self.buf[self.pos] in "\"{[" or (end < len(self.buf) and self.buf[end] in self.DELIMITERS):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.read_more()
+
+    def iter_object_array(self, _array_key, _other_values):
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            if key == _array_key and self.peek() == "[":
+                self.pos += 1
+                if self.peek() == "]":
+                    self.pos += 1
+                else:
+                    while True:
+                        yield self.value()
+                        if self.peek() != ",":
+                            break
+                        self.pos += 1
+                    self.expect("]")
+            else:
+                _other_values[key] = self.value()
+            if self.peek() != ",":
+                break
+            self.pos += 1
+        self.expect("}")
+
+class AssessmentWorkItem(object):
+
+    # Only these fields of an Assessment Summary are needed once its summary event is written,
+    # so the detail work list does not retain the whole summary dict
+    __slots__ = ("assessmentId", "lastUpdated", "templateName", "status", "residualRiskScore")
+
+    def __init__(self, _assessmentId, _lastUpdated, _templateName, _status=None, _residualRiskScore=None):
+        self.assessmentId = _assessmentId
+        self.lastUpdated = _lastUpdated
+        # Most assessments share a handful of templates and statuses
+        self.templateName = sys.intern(_templateName) if isinstance(_templateName, str) else _templateName
+        self.status = sys.intern(_status) if isinstance(_status, str) else _status
+        self.residualRiskScore = _residualRiskScore
+
+def compile_export_priority(_boosts):
+
+    # Sort key of the detail work list: the boost of an assessment, then its lastUpdated, both
+    # sorted descending. _boosts is e.g. {"status": {"UNDER_REVIEW": 10}, "residualRiskScore": 1}:
+    # a boost per status plus a weight multiplied by the residual risk score
+    statusBoosts = _boosts.get("status", {})
+    riskWeight = _boosts.get("residualRiskScore", 0)
+    if not isinstance(statusBoosts, dict) or not all(isinstance(boost, (int, float)) for boost in statusBoosts.values()):
+        raise ValueError("'status' must be an object of numeric boosts")
+    if not isinstance(riskWeight, (int, float)):
+        raise ValueError("'residualRiskScore' must be a numeric weight")
+    unknownKeys = set(_boosts) - {"status", "residualRiskScore"}
+    if unknownKeys:
+        raise ValueError(f"unknown boost '{sorted(unknownKeys)[0]}'")
+
+    def priority(_assessment):
+        boost = statusBoosts.get(_assessment.status, 0)
+        score = _assessment.residualRiskScore
+        if riskWeight and isinstance(score, (int, float)):
+            boost += riskWeight * score
+        return boost, _assessment.lastUpdated or ""
+    return priority
+
+def sample_work_items(_items, _size, _strategy, _rng):
+
+    # Random sample, or sample stratified by template and status with proportional allocation
+    if _size >= len(_items):
+        return list(_items)
+    if _strategy != "stratified":
+        return _rng.sample(_items, _size)
+
+    strata = collections.defaultdict(list)
+    for item in _items:
+        strata[(item.templateName, item.status)].append(item)
+    quotas = {key: _size * len(members) / len(_items) for key, members in strata.items()}
+    allocation = {key: int(quota) for key, quota in quotas.items()}
+    # The strata with the largest remainders get the rest of the sample
+    leftover = _size - sum(allocation.values())
+    for key in sorted(quotas, key=lambda _key: quotas[_key] - allocation[_key], reverse=True)[:leftover]:
+        allocation[key] += 1
+
+    sample = []
+    for key, members in strata.items():
+        sample.extend(_rng.sample(members, allocation[key]))
+    return sample
+
+def compile_field_keys(_keys, _default):
+
+    # Accessor for a chain of keys, e.g. ("orgGroup", "name"), returning _default when any key is missing
+    if len(_keys) == 0:
+        return lambda _data: _data
+
+    if len(_keys) == 1:
+        key = _keys[0]
+        def accessor(_data):
+            try:
+                return _data[key]
+            except (KeyError, TypeError, IndexError):
+                return _default
+        return accessor
+
+    if len(_keys) == 2:
+        first, second = _keys
+        def accessor(_data):
+            try:
+                return _data[first][second]
+            except (KeyError, TypeError, IndexError):
+                return _default
+        return accessor
+
+    def accessor(_data):
+        try:
+            for key in _keys:
+                _data = _data[key]
+            return _data
+        except (KeyError, TypeError, IndexError):
+            return _default
+    return accessor
+
+def compile_field_path(_path, _default, _fields=None, _item_default="n/a"):
+
+    # A path is a dot-separated chain of keys. "[]" maps the rest of the path, or the sub-fields
+    # of _fields, over every item of a list, e.g. "respondents[].name"
+    if _path is None:
+        return lambda _data: _default
+
+    head, is_list, tail = _path.partition("[]")
+    keys = tuple(key for key in head.split(".") if key)
+
+    if not is_list:
+        if _fields is not None:
+            raise ValueError(f"Field path '{_path}' needs '[]' to project fields")
+        return compile_field_keys(keys, _default)
+
+    get_list = compile_field_keys(keys, None)
+    if _fields is not None:
+        get_item = compile_field_spec(_fields, _item_default)
+    else:
+        get_item = compile_field_path(tail.lstrip(".") or None, _item_default) if tail else (lambda _item: _item)
+
+    def accessor(_data):
+        items = get_list(_data)
+        if not isinstance(items, list):
+            return _default
+        return [get_item(item) for item in items]
+    return accessor
+
+def compile_field_spec(_spec, _default):
+
+    # Compiles a field extraction spec once into a function building the event body.
+    # Every field is one of:
+    #   "path"                                       value at path, or _default
+    #   [path, default]                              value at path, or default (a null path is a constant)
+    #   {"path": ..., "fields": {...}, "default": ...} projection of the items of a list
+    #   {"path": ..., "optional": true}              value at path, left out of the event when missing
+    # A null field is left out of the event.
+    # Plain key paths are generated as inline dict lookups, so building an event costs about the
+    # same as a hand-written chain of lookups
+    missing = object()
+    namespace = {"_missing": missing}
+    lines = ["def build(_data):", "    if _data.__class__ is not dict:", "        _data = {}", "    retVal = {}"]
+
+    for index, (name, field) in enumerate(_spec.items()):
+        if field is None:
+            continue
+        fields = None
+        optional = False
+        if isinstance(field, str):
+            path, default = field, _default
+        elif isinstance(field, list) and len(field) == 2 and (field[0] is None or isinstance(field[0], str)):
+            path, default = field
+        elif isinstance(field, dict) and isinstance(field.get("path"), str):
+            path, default, fields, optional = field["path"], field.get("default", _default), field.get("fields"), bool(field.get("optional"))
+        else:
+            raise ValueError(f"Invalid extraction spec for field '{name}': {json.dumps(field)}")
+
+        target = f"retVal[{name!r}]"
+        namespace[f"_default{index}"] = default
+        keys = tuple(key for key in (path or "").split(".") if key)
+
+        if optional and ("[]" in path or fields is not None or not keys):
+            raise ValueError(f"Only a plain key path can be optional, field '{name}': {json.dumps(field)}")
+
+        if optional:
+            lines.append(f"    _value = _data.get({keys[0]!r}, _missing)")
+            for key in keys[1:]:
+                lines.append(f"    _value = _value.get({key!r}, _missing) if _value.__class__ is dict else _missing")
+            lines.append(f"    if _value is not _missing:")
+            lines.append(f"        {target} = _value")
+        elif path is None or not keys:
+            lines.append(f"    {target} = _default{index}")
+        elif "[]" in path or fields is not None:
+            namespace[f"_accessor{index}"] = compile_field_path(path, default, fields, _default)
+            lines.append(f"    {target} = _accessor{index}(_data)")
+        elif len(keys) == 1:
+            lines.append(f"    {target} = _data.get({keys[0]!r}, _default{index})")
+        else:
+            lines.append(f"    _value = _data.get({keys[0]!r}, _missing)")
+            for key in keys[1:]:
+                lines.append(f"    _value = _value.get({key!r}, _missing) if _value.__class__ is dict else _missing")
+            lines.append(f"    {target} = _default{index} if _value is _missing else _value")
+
+    lines.append("    return retVal")
+    exec(compile("\n".join(lines), "<field spec>", "exec"), namespace)
+    return namespace["build"]
+
+class FieldProjection(object):
+
+    # Include/exclude lists of top-level fields applied to an event body before it is serialized.
+    # The dropped fields are counted. Their serialized size is only measured on request, as it costs
+    # as much as writing them.
+    def __init__(self, _include, _exclude, _count_bytes=False):
+        self.include = frozenset(_include) if _include else None
+        self.exclude = frozenset(_exclude or ())
+        self.count_bytes = _count_bytes
+        self.dropped_fields = 0
+        self.saved_bytes = 0
+
+    def apply(self, _body):
+        projected = {}
+        for key, value in _body.items():
+            if (self.include is None or key in self.include) and key not in self.exclude:
+                projected[key] = value
+            else:
+                self.dropped_fields += 1
+                if self.count_bytes:
+                    # Key, value, '": ' and ', ' separators
+                    self.saved_bytes += len(json.dumps(key)) + len(json.dumps(value)) + 4
+        return projected
+
+def parse_retry_after(_value, _default):
+
+    # Retry-After is either a number of seconds or an HTTP date
+    if _value is None:
+        return _default
+    try:
+        return max(0.0, float(_value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(_value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return _default
+
+class RequestThrottler(object):
+
+    # Token bucket shared by every thread of the run. The request rate starts at the configured
+    # ceiling, is halved on every 429 and grows back by about 1 call/s per second of successful calls.
+    # Without a ceiling calls are not limited until the first 429, the bucket then starts from the
+    # call rate observed over the last OBSERVATION_WINDOW seconds. Retry-After is always honored.
+    OBSERVATION_WINDOW = 10.0
+
+    def __init__(self, _max_calls_per_sec):
+        self.max_rate = float(_max_calls_per_sec)
+        self.min_rate = max(0.1, self.max_rate / 100)
+        self.rate = self.max_rate
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.rate_limited = 0
+        self.started = self.updated
+        self.recent_calls = collections.deque()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if self.max_rate > 0:
+                    self.tokens = min(max(1.0, self.rate), self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                wait = self.blocked_until - now
+                if wait <= 0:
+                    if self.max_rate <= 0:
+                        self.recent_calls.append(now)
+                        while self.recent_calls[0] < now - self.OBSERVATION_WINDOW:
+                            self.recent_calls.popleft()
+                        return
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def observed_rate(self, _now):
+        window = min(self.OBSERVATION_WINDOW, _now - self.started)
+        return len(self.recent_calls) / window if window > 0 else float(len(self.recent_calls))
+
+    def on_success(self):
+        if self.max_rate <= 0 or self.rate >= self.max_rate:
+            return
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + 1.0 / self.rate)
+
+    def on_rate_limited(self, _retry_after):
+        with self.lock:
+            self.rate_limited += 1
+            now = time.monotonic()
+            self.blocked_until = max(self.blocked_until, now + _retry_after)
+            if self.max_rate <= 0:
+                # The API limit was reached at the observed rate, which becomes the ceiling
+                self.max_rate = max(1.0, self.observed_rate(now))
+                self.min_rate = max(0.1, self.max_rate / 100)
+                self.rate = self.max_rate
+                self.recent_calls.clear()
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0.0
+            self.updated = now
+
+class RetryPolicy(object):
+
+    # Exponential backoff capped at max_delay. Jitter (0 to 1) is the share of each delay that is
+    # randomized, so that parallel workers do not retry in lockstep.
+    RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+    def __init__(self, _attempts, _base_delay, _max_delay, _jitter):
+        self.attempts = max(1, _attempts)
+        self.base_delay = max(0.0, _base_delay)
+        self.max_delay = max(self.base_delay, _max_delay)
+        self.jitter = min(1.0, max(0.0, _jitter))
+        self.retries = 0
+        self.failures = 0
+        self.lock = threading.Lock()
+
+    def delay(self, _attempt):
+        delay = min(self.max_delay, self.base_delay * (2 ** (_attempt - 1)))
+        return delay * (1 - self.jitter * random.random())
+
+    def record_retry(self):
+        with self.lock:
+            self.retries += 1
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+
+def percentile(_sorted_values, _percent):
+
+    # Nearest-rank percentile of an already sorted sequence
+    if len(_sorted_values) == 0:
+        return None
+    rank = max(1, int(-(-len(_sorted_values) * _percent // 100)))
+    return _sorted_values[rank - 1]
+
+def peak_rss_mb():
+
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return round(peak_rss / (1024.0 * 1024.0) if sys.platform == "darwin" else peak_rss / 1024.0, 1)
+
+class SamplingProfiler(object):
+
+    # Statistical profiler sampling the stacks of every thread from a background thread, so that
+    # the export workers are profiled too and the overhead does not grow with the number of calls.
+    # Same enable/disable interface as cProfile.Profile
+    # Innermost frames of threads parked until there is work: condition, event and queue waits, and
+    # idle ThreadPoolExecutor workers blocked in the C queue. Such samples are not counted
+    IDLE_FUNCTIONS = (("threading", "Condition.wait"), ("threading", "Thread._wait_for_tstate_lock"),
+                      ("threading", "Thread.join"), ("concurrent.futures.thread", "_worker"))
+    # Thread start-up frames at the bottom of every worker stack, kept out of the ranking
+    BOOTSTRAP_FUNCTIONS = (("threading", "Thread._bootstrap"), ("threading", "Thread._bootstrap_inner"),
+                           ("threading", "Thread.run"), ("concurrent.futures.thread", "_worker"))
+
+    def __init__(self, _interval):
+        self.interval = _interval
+        self.samples = 0
+        self.own_samples = collections.Counter()
+        self.cumulative_samples = collections.Counter()
+        self.stacks = collections.Counter()
+        self.stop = threading.Event()
+        self.thread = None
+        self.idle_codes = frozenset()
+        self.bootstrap_codes = frozenset()
+
+    @staticmethod
+    def resolve_codes(_functions):
+        # Most of these are interpreter internals, those missing from this interpreter are skipped
+        codes = set()
+        for module_name, attribute in _functions:
+            try:
+                target = importlib.import_module(module_name)
+            except ImportError:
+                continue
+            for name in attribute.split("."):
+                target = getattr(target, name, None)
+            code = getattr(target, "__code__", None)
+            if code is not None:
+                codes.add(code)
+        return frozenset(codes)
+
+    def enable(self):
+        self.idle_codes = self.resolve_codes(self.IDLE_FUNCTIONS)
+        self.bootstrap_codes = self.resolve_codes(self.BOOTSTRAP_FUNCTIONS)
+        self.stop.clear()
+        self.thread = threading.Thread(target=self.sample_periodically, name="onetrust-profiler", daemon=True)
+        self.thread.start()
+
+    def disable(self):
+        self.stop.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def sample_periodically(self):
+        own_thread = threading.get_ident()
+        while not self.stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread or frame.f_code in self.idle_codes:
+                    continue
+                stack = []
+                ranked = set()
+                while frame is not None:
+                    code = frame.f_code
+                    function = f"{os.path.basename(code.co_filename)}:{code.co_firstlineno}({code.co_name})"
+                    stack.append(function)
+                    # A recursive function is only counted once per sample
+                    if code not in self.bootstrap_codes:
+                        ranked.add(function)
+                    frame = frame.f_back
+                self.samples += 1
+                self.own_samples[stack[0]] += 1
+                self.cumulative_samples.update(ranked)
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def top(self, _count):
+        return [(function, samples, self.own_samples[function]) for function, samples in self.cumulative_samples.most_common(_count)]
+
+    def dump_stats(self, _path):
+        # Collapsed stacks, the input format of flame graph tools
+        with open(_path, "w") as f:
+            for stack, samples in self.stacks.most_common():
+                f.write(f"{stack} {samples}\n")
+
+class RunMetrics(object):
+
+    # Counters of a run, shared by the export workers, written as one onetrust:collector:metrics event.
+    # Latencies are kept in compact arrays of seconds, so that exact percentiles can be reported
+    def __init__(self):
+        self.page_latencies = array.array("d")
+        self.export_latencies = array.array("d")
+        self.bytes_downloaded = 0
+        self.responses = collections.Counter()
+        self.events = collections.Counter()
+        self.event_bytes = collections.Counter()
+        self.full_run_estimate = None
+        self.lock = threading.Lock()
+
+    def observe_page(self, _seconds, _bytes):
+        with self.lock:
+            self.page_latencies.append(_seconds)
+            self.bytes_downloaded += _bytes
+
+    def observe_export(self, _seconds, _bytes):
+        with self.lock:
+            self.export_latencies.append(_seconds)
+            self.bytes_downloaded += _bytes
+
+    def observe_response(self, _status_code):
+        with self.lock:
+            self.responses[f"{_status_code // 100}xx"] += 1
+            if _status_code == 429:
+                self.responses["429"] += 1
+
+    def observe_connection_error(self):
+        with self.lock:
+            self.responses["connectionErrors"] += 1
+
+    def observe_event(self, _sourcetype, _bytes):
+        # Only called by the thread writing events
+        self.events[_sourcetype] += 1
+        self.event_bytes[_sourcetype] += _bytes
+
+    def latency_summary(self, _latencies):
+        latencies = sorted(_latencies)
+        toMs = lambda _seconds: None if _seconds is None else round(_seconds * 1000, 1)
+        return {
+            "count": len(latencies),
+            "avgMs": toMs(sum(latencies) / len(latencies)) if latencies else None,
+            "p50Ms": toMs(percentile(latencies, 50)),
+            "p95Ms": toMs(percentile(latencies, 95)),
+            "p99Ms": toMs(percentile(latencies, 99)),
+            "maxMs": toMs(latencies[-1] if latencies else None)
+        }
+
+    def to_event(self):
+        with self.lock:
+            event = {
+                "summaryPages": self.latency_summary(self.page_latencies),
+                "exports": self.latency_summary(self.export_latencies),
+                "bytesDownloaded": self.bytes_downloaded,
+                "responses": {key: self.responses[key] for key in ("2xx", "4xx", "429", "5xx", "connectionErrors")},
+                "events": {sourcetype: {"count": count, "bytes": self.event_bytes[sourcetype]} for sourcetype, count in self.events.items()},
+                "peakRssMb": peak_rss_mb()
+            }
+            if self.full_run_estimate is not None:
+                event["fullRunEstimate"] = self.full_run_estimate
+            return event
+
+class HecDeliveryError(Exception):
+    pass
+
+class HecEventSink(object):
+
+    # Sends events to the HTTP Event Collector instead of splunkd's stdin, in gzipped batches of
+    # newline-separated JSON over one keep-alive session. Batches go to the raw endpoint, one
+    # sourcetype per batch, so that line breaking, timestamp and indexed extractions of props.conf
+    # apply as they do to the events written to splunkd. With indexer acknowledgement a batch is
+    # kept until HEC confirms it was indexed, and batches still unconfirmed at the end are posted again.
+    RAW_PATH = "/services/collector/raw"
+    ACK_PATH = "/services/collector/ack"
+    # Below the default max_content_length of HEC
+    MAX_BATCH_BYTES = 1000000
+    RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+    ACK_POLL_INTERVAL = 1.0
+    ACK_RESENDS = 1
+
+    def __init__(self, _ew, _url, _token, _batch_size, _retry_policy, _use_ack=False, _ack_timeout=60.0, _verify=True, _metadata=None, _timeout=None):
+        self.ew = _ew
+        self.url = _url.rstrip("/")
+        self.batch_size = max(1, _batch_size)
+        self.retry_policy = _retry_policy
+        self.use_ack = _use_ack
+        self.ack_timeout = _ack_timeout
+        # (connect, read) timeout of every call, so that a stalled HEC fails the run instead of hanging it
+        self.timeout = _timeout
+        # source, host and index of every event, passed as query parameters of the raw endpoint
+        self.metadata = {key: value for key, value in (_metadata or {}).items() if value}
+
+        self.session = requests.Session()
+        self.session.verify = _verify
+        # The raw endpoint requires a channel
+        self.session.headers.update({"Authorization": f"Splunk {_token}", "Content-Encoding": "gzip", "X-Splunk-Request-Channel": str(uuid.uuid4())})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        # sourcetype -> [serialized events, bytes]
+        self.batches = {}
+        # ackId -> (sourcetype, gzipped batch, number of events)
+        self.pending_acks = {}
+        self.last_ack_poll = time.time()
+        self.events_sent = 0
+        self.batches_sent = 0
+        self.bytes_sent = 0
+        self.dropped_events = 0
+
+    def write(self, _sourcetype, _data):
+        batch = self.batches.get(_sourcetype)
+        if batch is None:
+            batch = self.batches[_sourcetype] = [[], 0]
+        batch[0].append(_data)
+        batch[1] += len(_data) + 1
+        if len(batch[0]) >= self.batch_size or batch[1] >= self.MAX_BATCH_BYTES:
+            self.flush_batch(_sourcetype)
+        elif self.pending_acks and time.time() - self.last_ack_poll >= self.ACK_POLL_INTERVAL:
+            self.poll_acks()
+
+    def flush_batch(self, _sourcetype):
+        events = self.batches.pop(_sourcetype)[0]
+        payload = gzip.compress("\n".join(events).encode("utf-8"), compresslevel=5)
+        self.post_batch(_sourcetype, payload, len(events))
+
+    def flush(self):
+        for sourcetype in list(self.batches):
+            self.flush_batch(sourcetype)
+        if self.pending_acks and time.time() - self.last_ack_poll >= self.ACK_POLL_INTERVAL:
+            self.poll_acks()
+
+    def post(self, _path, _body, _headers=None, _params=None):
+        attempt = 1
+        while True:
+            try:
+                response = self.session.post(self.url + _path, data=_body, headers=_headers, params=_params, timeout=self.timeout)
+                if response.status_code not in self.RETRY_STATUS_CODES or attempt >= self.retry_policy.attempts:
+                    return response
+                reason = f"request_status_code={str(response.status_code)}"
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt >= self.retry_policy.attempts:
+                    raise
+                reason = f"err_msg=\"{str(e)}\""
+
+            delay = self.retry_policy.delay(attempt)
+            self.retry_policy.record_retry()
+            self.ew.log("WARN", f"HEC call failed with {reason}. Retrying in {str(round(delay, 2))} s, attempt {str(attempt + 1)} of {str(self.retry_policy.attempts)}. url={self.url + _path}")
+            time.sleep(delay)
+            attempt += 1
+
+    def post_batch(self, _sourcetype, _payload, _count):
+        # A batch that HEC did not accept fails the run, so that its assessments are not checkpointed
+        params = dict(self.metadata, sourcetype=_sourcetype)
+        try:
+            response = self.post(self.RAW_PATH, _payload, _params=params)
+        except Exception as e:
+            self.retry_policy.record_failure()
+            self.dropped_events += _count
+            raise HecDeliveryError(f"Unable to send {str(_count)} event(s) to HEC. err_msg=\"{str(e)}\"")
+
+        if response.status_code != 200:
+            self.retry_policy.record_failure()
+            self.dropped_events += _count
+            raise HecDeliveryError(f"HEC returned request_status_code={str(response.status_code)}, {str(_count)} event(s) were not indexed. response=\"{response.text[:200]}\"")
+
+        self.batches_sent += 1
+        self.events_sent += _count
+        self.bytes_sent += len(_payload)
+        if self.use_ack:
+            try:
+                ackId = response.json().get("ackId")
+            except ValueError:
+                ackId = None
+            if ackId is not None:
+                self.pending_acks[ackId] = (_sourcetype, _payload, _count)
+
+    def poll_acks(self):
+        self.last_ack_poll = time.time()
+        try:
+            # The ack query is not compressed
+            response = self.post(self.ACK_PATH, json.dumps({"acks": list(self.pending_acks)}), {"Content-Encoding": None, "Content-Type": "application/json"})
+            if response.status_code != 200:
+                self.ew.log("WARN", f"HEC acknowledgement query returned request_status_code={str(response.status_code)}")
+                return
+            for ackId, indexed in response.json().get("acks", {}).items():
+                if indexed:
+                    self.pending_acks.pop(int(ackId), None)
+        except Exception as e:
+            self.ew.log("WARN", f"Unable to query HEC acknowledgements. err_msg=\"{str(e)}\"")
+
+    def drain(self):
+        # Sends the pending batches and waits for their acknowledgement. Raises HecDeliveryError when
+        # any event of the run was not accepted, or not acknowledged as indexed after one resend
+        self.flush()
+
+        resends = 0
+        deadline = time.time() + self.ack_timeout
+        while self.pending_acks:
+            if time.time() >= deadline:
+                if resends >= self.ACK_RESENDS:
+                    break
+                unacknowledged = list(self.pending_acks.values())
+                self.pending_acks = {}
+                self.ew.log("WARN", f"{str(len(unacknowledged))} HEC batch(es) were not acknowledged within {str(self.ack_timeout)} s and are sent again.")
+                for sourcetype, payload, count in unacknowledged:
+                    self.events_sent -= count
+                    self.post_batch(sourcetype, payload, count)
+                resends += 1
+                deadline = time.time() + self.ack_timeout
+                continue
+            time.sleep(self.ACK_POLL_INTERVAL)
+            self.poll_acks()
+
+        if self.dropped_events:
+            raise HecDeliveryError(f"{str(self.dropped_events)} event(s) were not accepted by HEC.")
+        unacknowledgedEvents = sum(count for sourcetype, payload, count in self.pending_acks.values())
+        if unacknowledgedEvents:
+            raise HecDeliveryError(f"{str(unacknowledgedEvents)} event(s) sent to HEC were never acknowledged as indexed.")
+
+    def close(self):
+        # After a failed delivery the remaining batches are discarded, the run is exported again
+        if not self.dropped_events:
+            try:
+                self.drain()
+            except HecDeliveryError as e:
+                self.ew.log("ERROR", str(e))
+        self.session.close()
+        unsentEvents = sum(len(batch[0]) for batch in self.batches.values())
+        unacknowledgedEvents = sum(count for sourcetype, payload, count in self.pending_acks.values())
+        self.ew.log("INFO", f"HEC sink closed. events_sent={str(self.events_sent)} batches_sent={str(self.batches_sent)} bytes_sent={str(self.bytes_sent)} dropped_events={str(self.dropped_events)} unsent_events={str(unsentEvents)} unacknowledged_events={str(unacknowledgedEvents)} retries={str(self.retry_policy.retries)}")
+
+def checkpoint_file_path(_checkpoint_dir, _input_name, _suffix):
+    # Files of an input in the checkpoint directory are named after its stanza
+    return os.path.join(_checkpoint_dir, re.sub(r"[^\w.-]", "_", _input_name) + _suffix)
+
+class StateFile(object):
+
+    # JSON file of an input in the checkpoint directory, recorded against a scope such as the tenant
+    # and archival state. A file recorded against another scope is ignored. Saves are atomic, so that
+    # a run killed while saving leaves the previous file behind.
+    def __init__(self, _checkpoint_dir, _input_name, _suffix, _scope):
+        self.path = checkpoint_file_path(_checkpoint_dir, _input_name, _suffix)
+        self.scope = _scope
+
+    def load(self):
+        # Returns the recorded state, or None when there is none for this scope
+        if not os.path.isfile(self.path):
+            return None
+        with open(self.path, "r") as f:
+            state = json.load(f)
+        if not isinstance(state, dict) or any(state.get(key) != value for key, value in self.scope.items()):
+            return None
+        return state
+
+    def save(self, _state):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(dict(self.scope, **_state), f)
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        if os.path.isfile(self.path):
+            os.remove(self.path)
+
+class AssessmentCheckpoint(object):
+
+    # Records assessmentId -> lastUpdated of every exported assessment, so that the next run
+    # only calls the export API for new or changed assessments. The fingerprint of the settings that
+    # shape the events is recorded too: once they change, every assessment is exported again.
+    def __init__(self, _checkpoint_dir, _input_name, _base_url, _output_fingerprint=None):
+        self.state_file = StateFile(_checkpoint_dir, _input_name, ".checkpoint.json", {"tenantHostname": _base_url})
+        self.path = self.state_file.path
+        self.output_fingerprint = _output_fingerprint
+        self.output_changed = False
+        self.assessments = {}
+
+    def load(self):
+        checkpoint = self.state_file.load()
+        if checkpoint is None:
+            return
+        # Checkpoints recorded before the fingerprint was introduced are kept
+        recorded = checkpoint.get("outputFingerprint")
+        if recorded is not None and recorded != self.output_fingerprint:
+            self.output_changed = True
+            return
+        self.assessments = checkpoint.get("assessments", {})
+
+    def is_changed(self, _assessmentId, _lastUpdated):
+        if _lastUpdated is None:
+            return True
+        return self.assessments.get(_assessmentId) != _lastUpdated
+
+    def update(self, _assessmentId, _lastUpdated):
+        if _lastUpdated is not None:
+            self.assessments[_assessmentId] = _lastUpdated
+
+    def retain(self, _assessmentIds):
+        self.assessments = {k: v for k, v in self.assessments.items() if k in _assessmentIds}
+
+    def save(self):
+        self.state_file.save({"outputFingerprint": self.output_fingerprint, "assessments": self.assessments})
+
+class RunCursor(object):
+
+    # Progress of the current run: the summary pages whose summaries and exports are all written and
+    # the assessments already exported. The cursor is left behind by a run that did not complete,
+    # so that the next run resumes it instead of starting again from page 0.
+    def __init__(self, _checkpoint_dir, _input_name, _base_url, _archival_state, _output_fingerprint=None):
+        # A run interrupted before the output settings changed is not resumed
+        self.state_file = StateFile(_checkpoint_dir, _input_name, ".cursor.json", {"tenantHostname": _base_url, "archivalState": _archival_state, "outputFingerprint": _output_fingerprint})
+        self.path = self.state_file.path
+        self.run_id = uuid.uuid4().hex
+        self.resumed = False
+        self.completed_pages = set()
+        self.exported = {}
+        # Pages of the work items handed to the detail loop and not yet exported
+        self.pending = {}
+        self.pending_pages = collections.Counter()
+        self.summarized_pages = 0
+        self.last_save = time.time()
+
+    def load(self):
+        cursor = self.state_file.load()
+        if cursor is not None:
+            self.run_id = cursor.get("runId", self.run_id)
+            self.completed_pages = set(cursor.get("completedPages", []))
+            self.exported = cursor.get("exportedIds", {})
+            self.resumed = True
+
+    def is_exported(self, _assessmentId, _lastUpdated):
+        # An assessment changed since it was exported is exported again
+        return self.exported.get(_assessmentId, self) == _lastUpdated
+
+    def page_started(self, _page):
+        # Summaries are written in page order, so every page before _page is summarized
+        self.summarized_pages = _page
+
+    def item_started(self, _assessmentId, _page):
+        self.pending[_assessmentId] = _page
+        self.pending_pages[_page] += 1
+
+    def item_done(self, _assessmentId, _lastUpdated, _exported):
+        # The work list may be reordered, so a page is only completed once none of its items is pending
+        page = self.pending.pop(_assessmentId, None)
+        if page is not None:
+            self.pending_pages[page] -= 1
+            if self.pending_pages[page] <= 0:
+                del self.pending_pages[page]
+        if _exported:
+            self.exported[_assessmentId] = _lastUpdated
+        completed_below = min(self.pending_pages) if self.pending_pages else self.summarized_pages
+        self.completed_pages.update(range(completed_below))
+
+    def is_due(self, _interval):
+        return time.time() - self.last_save >= _interval
+
+    def save(self):
+        self.state_file.save({"runId": self.run_id, "completedPages": sorted(self.completed_pages), "exportedIds": self.exported})
+        self.last_save = time.time()
+
+    def remove(self):
+        self.state_file.remove()
+
+class ExportBacklog(object):
+
+    # Assessments left unexported by a run that ran out of its time budget. The next run exports
+    # them first, so that the tenant is fully covered over several runs.
+    def __init__(self, _checkpoint_dir, _input_name, _base_url, _archival_state):
+        self.state_file = StateFile(_checkpoint_dir, _input_name, ".backlog.json", {"tenantHostname": _base_url, "archivalState": _archival_state})
+        self.path = self.state_file.path
+        self.assessments = []
+
+    def load(self):
+        backlog = self.state_file.load()
+        if backlog is not None:
+            self.assessments = [AssessmentWorkItem(*assessment) for assessment in backlog.get("assessments", [])]
+
+    def save(self, _assessments):
+        self.state_file.save({"assessments": [[a.assessmentId, a.lastUpdated, a.templateName, a.status, a.residualRiskScore] for a in _assessments]})
+
+    def remove(self):
+        self.state_file.remove()
+
+class ExportCache(object):
+
+    # Size-capped LRU cache of gzipped export payloads in the checkpoint directory, shared by every
+    # input of the same tenant. Entries are keyed by (tenant, assessmentId, lastUpdated) and the file
+    # modification time is used as the last access time across runs. Every input runs in its own
+    # process, so the directory is scanned again before evicting and the cap holds for all of them.
+    FILE_SUFFIX = ".json.gz"
+    # Eviction goes below the cap, so that the directory is not scanned again on every put
+    LOW_WATER_MARK = 0.9
+    # Temporary files older than this were left by a process killed while writing
+    TMP_MAX_AGE = 3600
+
+    def __init__(self, _cache_dir, _max_bytes):
+        self.cache_dir = _cache_dir
+        self.max_bytes = _max_bytes
+        self.entries = collections.OrderedDict()
+        self.versions = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def load(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with self.lock:
+            self.scan()
+            self.evict()
+
+    def scan(self):
+        cached_files = []
+        now = time.time()
+        for entry in os.scandir(self.cache_dir):
+            try:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+            except OSError:
+                # Evicted by another input meanwhile
+                continue
+            if entry.name.endswith(self.FILE_SUFFIX):
+                cached_files.append((stat.st_mtime, entry.name, stat.st_size))
+            elif entry.name.endswith(".tmp") and now - stat.st_mtime > self.TMP_MAX_AGE:
+                self.remove_file(entry.name)
+        self.entries = collections.OrderedDict()
+        self.versions = {}
+        self.total_bytes = 0
+        # Least recently used first
+        for mtime, name, size in sorted(cached_files):
+            self.entries[name] = size
+            self.versions[name.split(".", 1)[0]] = name
+            self.total_bytes += size
+
+    def file_name(self, _tenant, _assessmentId, _lastUpdated):
+        assessment_key = hashlib.sha1(f"{_tenant}|{_assessmentId}".encode("utf-8")).hexdigest()
+        version_key = hashlib.sha1(str(_lastUpdated).encode("utf-8")).hexdigest()[:16]
+        return f"{assessment_key}.{version_key}{self.FILE_SUFFIX}"
+
+    def get(self, _tenant, _assessmentId, _lastUpdated):
+        name = self.file_name(_tenant, _assessmentId, _lastUpdated)
+        path = os.path.join(self.cache_dir, name)
+
+        with self.lock:
+            if name not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(name)
+
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                payload = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            with self.lock:
+                self.forget(name)
+                self.misses += 1
+            return None
+
+        with self.lock:
+            self.hits += 1
+        return payload
+
+    def put(self, _tenant, _assessmentId, _lastUpdated, _payload):
+        name = self.file_name(_tenant, _assessmentId, _lastUpdated)
+        path = os.path.join(self.cache_dir, name)
+
+        data = gzip.compress(json.dumps(_payload).encode("utf-8"), compresslevel=5)
+        if len(data) > self.max_bytes:
+            return
+
+        tmp_path = f"{path}.{str(os.getpid())}.{str(threading.get_ident())}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self.lock:
+            # The previous version of the same assessment will never be read again
+            assessment_key = name.split(".", 1)[0]
+            previous = self.versions.get(assessment_key)
+            if previous is not None and previous != name:
+                self.forget(previous)
+                self.remove_file(previous)
+            if name in self.entries:
+                self.total_bytes -= self.entries[name]
+            self.entries[name] = len(data)
+            self.entries.move_to_end(name)
+            self.versions[assessment_key] = name
+            self.total_bytes += len(data)
+            self.evict()
+
+    def evict(self):
+        if self.total_bytes <= self.max_bytes:
+            return
+        # The other inputs sharing the directory have added and evicted entries since the last scan
+        self.scan()
+        if self.total_bytes <= self.max_bytes:
+            return
+        while self.total_bytes > self.max_bytes * self.LOW_WATER_MARK and self.entries:
+            name = next(iter(self.entries))
+            self.forget(name)
+            self.remove_file(name)
+            self.evictions += 1
+
+    def forget(self, _name):
+        size = self.entries.pop(_name, None)
+        if size is not None:
+            self.total_bytes -= size
+        assessment_key = _name.split(".", 1)[0]
+        if self.versions.get(assessment_key) == _name:
+            del self.versions[assessment_key]
+
+    def remove_file(self, _name):
+        try:
+            os.remove(os.path.join(self.cache_dir, _name))
+        except OSError:
+            pass
 
 class OneTrustAssessments(Script):
     
     MASK = "***ENCRYPTED***"
     NO_JSON_DATA = "n/a"
+    RATE_LIMIT_MAX_RETRIES = 10
+    RATE_LIMIT_DEFAULT_WAIT = 1.0
+    STREAM_CHUNK_SIZE = 65536
+    RUN_CURSOR_SAVE_INTERVAL = 5.0
+    PROFILE_SAMPLE_INTERVAL = 0.005
+    # Share of max_run_seconds kept for the exports in flight and the remaining summary pages
+    RUN_BUDGET_MARGIN = 0.1
+    REQUEST_TITLE_QUESTION = "Please provide a request title"
+    EMPTY_JSON_OBJECT = {}
+    FAQ_SECTION_PATTERN = re.compile(r"Frequently\sAsked\sQuestions?")
+
+    # Fields of the onetrust:assessment:details event, see compile_field_spec
+    DETAILS_FIELD_SPEC = {
+        "assessmentId": "assessmentId",
+        "assessmentNumber": "assessmentNumber",
+        "lastUpdated": "lastUpdated",
+        "submittedOn": "submittedOn",
+        "completedOn": "completedOn",
+        "createdDT": "createdDT",
+        "template": [None, NO_JSON_DATA],
+        "templateName": {"path": "template.name", "optional": True},
+        "title": "name",
+        "orgGroup": "orgGroup.name",
+        "createdBy": "createdBy.name",
+        # Filled by assessment_events_bldr while it walks the sections
+        "responseTitle": [None, NO_JSON_DATA],
+        "approvalInfo": {
+            "path": "approvers[]",
+            "fields": {"approvers": "approver.fullName", "approvedOn": "approvedOn", "approverResult": "resultName"},
+            "default": []
+        },
+        "respondent": "respondent.name",
+        "respondents": "respondents[].name",
+        "status": "status",
+        "result": "result",
+        "riskLevel": "residualRiskScore"
+    }
+
+    SOURCETYPES = ("onetrust:assessment:summary", "onetrust:assessment:details", "onetrust:assessment:qna", "onetrust:assessment:question", "onetrust:collector:metrics")
+
+    # 'array' writes the questions of an assessment as one onetrust:assessment:qna event, 'per_question'
+    # as one onetrust:assessment:question event each, 'both' writes both while searches are migrated
+    QNA_EVENT_MODES = ("array", "per_question", "both")
+
+    def __init__(self):
+        super(OneTrustAssessments, self).__init__()
+        self.details_bldr = compile_field_spec(self.DETAILS_FIELD_SPEC, self.NO_JSON_DATA)
+        self.details_field_spec = self.DETAILS_FIELD_SPEC
+        self.field_projections = {}
+        self.field_projection_spec = {}
+        self.qna_event_mode = "array"
+        # (connect, read) timeout of the OneTrust API calls
+        self.request_timeout = None
+        # Decrypted credentials by tenant, kept for the lifetime of the process
+        self.credential_cache = {}
+        self.event_sink = None
     
     def get_scheme(self):
         scheme = Scheme("OneTrust Assessments")
@@ -50,349 +1168,1330 @@ class OneTrustAssessments(Script):
         test_mode.required_on_edit = False
         scheme.add_argument(test_mode)
         
+        test_sample_size = Argument("test_sample_size")
+        test_sample_size.title = "Test Mode Sample Size"
+        test_sample_size.data_type = Argument.data_type_number
+        test_sample_size.description = "In test mode, number of page 0 assessments whose Assessment Details are exported to estimate the duration, API calls and event volume of a full run. Defaults to 0 (no export in test mode)."
+        test_sample_size.required_on_create = False
+        test_sample_size.required_on_edit = False
+        scheme.add_argument(test_sample_size)
+        
+        test_sample_strategy = Argument("test_sample_strategy")
+        test_sample_strategy.title = "Test Mode Sample Strategy"
+        test_sample_strategy.data_type = Argument.data_type_string
+        test_sample_strategy.description = "'random' for a uniform sample, or 'stratified' for a sample proportional to every template and status. Defaults to 'random'."
+        test_sample_strategy.required_on_create = False
+        test_sample_strategy.required_on_edit = False
+        scheme.add_argument(test_sample_strategy)
+        
+        details_field_spec = Argument("details_field_spec")
+        details_field_spec.title = "Details Field Spec"
+        details_field_spec.data_type = Argument.data_type_string
+        details_field_spec.description = "JSON object merged into the default field extraction of Assessment Details, e.g. {\"owner\": \"owner.name\", \"riskLevel\": [\"residualRiskScore\", 0], \"template\": null}. A value is a dot-separated path, a [path, default] pair, {\"path\": path, \"optional\": true} to leave the field out when the path is missing, or null to remove the field. Changing it exports every assessment again on the next run."
+        details_field_spec.required_on_create = False
+        details_field_spec.required_on_edit = False
+        scheme.add_argument(details_field_spec)
+        
+        field_projection = Argument("field_projection")
+        field_projection.title = "Field Projection"
+        field_projection.data_type = Argument.data_type_string
+        field_projection.description = "JSON object of include/exclude lists of top-level fields per sourcetype, applied before the events are written, e.g. {\"onetrust:assessment:summary\": {\"exclude\": [\"tags\", \"apiPage\"]}, \"onetrust:assessment:qna\": {\"include\": [\"assessmentId\", \"questionsAndAnswers\"]}}. Changing it exports every assessment again on the next run."
+        field_projection.required_on_create = False
+        field_projection.required_on_edit = False
+        scheme.add_argument(field_projection)
+        
+        qna_event_mode = Argument("qna_event_mode")
+        qna_event_mode.title = "Questions and Responses Event Mode"
+        qna_event_mode.data_type = Argument.data_type_string
+        qna_event_mode.description = "'array' writes the questions of an assessment as one onetrust:assessment:qna event, 'per_question' as one compact onetrust:assessment:question event per question (assessmentId, sectionName, seqNum, question, responses, primkey, lastUpdated), 'both' writes both. sectionName is the section of the question, where the array event has the last section of the assessment, so primkey differs from the key of the array based lookup updater for questions outside the last section. Changing the mode exports every assessment again on the next run. Defaults to 'array'."
+        qna_event_mode.required_on_create = False
+        qna_event_mode.required_on_edit = False
+        scheme.add_argument(qna_event_mode)
+        
+        output_buffer_bytes = Argument("output_buffer_bytes")
+        output_buffer_bytes.title = "Output Buffer Size"
+        output_buffer_bytes.data_type = Argument.data_type_number
+        output_buffer_bytes.description = "Number of bytes of serialized events buffered before they are written to splunkd in one batch. Defaults to 0 (every event is written and flushed on its own)."
+        output_buffer_bytes.required_on_create = False
+        output_buffer_bytes.required_on_edit = False
+        scheme.add_argument(output_buffer_bytes)
+        
+        output_flush_interval = Argument("output_flush_interval")
+        output_flush_interval.title = "Output Flush Interval"
+        output_flush_interval.data_type = Argument.data_type_number
+        output_flush_interval.description = "Maximum number of seconds an event stays in the output buffer. Defaults to 5."
+        output_flush_interval.required_on_create = False
+        output_flush_interval.required_on_edit = False
+        scheme.add_argument(output_flush_interval)
+        
+        hec_url = Argument("hec_url")
+        hec_url.title = "HEC URL"
+        hec_url.data_type = Argument.data_type_string
+        hec_url.description = "Base URL of an HTTP Event Collector, e.g. https://hec.example.com:8088. When set, events are sent to the raw endpoint of HEC in gzipped batches instead of being written to splunkd, and parsed with the props.conf settings of their sourcetype. A run whose events are not all accepted (and acknowledged with hec_use_ack) by HEC fails without saving its checkpoint, so that the next run exports them again. Defaults to empty (events are written to splunkd)."
+        hec_url.required_on_create = False
+        hec_url.required_on_edit = False
+        scheme.add_argument(hec_url)
+        
+        hec_token = Argument("hec_token")
+        hec_token.title = "HEC Token"
+        hec_token.data_type = Argument.data_type_string
+        hec_token.description = "Token of the HTTP Event Collector. It is stored encrypted and masked in inputs.conf like the API token."
+        hec_token.required_on_create = False
+        hec_token.required_on_edit = False
+        scheme.add_argument(hec_token)
+        
+        hec_batch_size = Argument("hec_batch_size")
+        hec_batch_size.title = "HEC Batch Size"
+        hec_batch_size.data_type = Argument.data_type_number
+        hec_batch_size.description = "Number of events sent to HEC in one request, capped at about 1 MB of uncompressed events. Defaults to 500."
+        hec_batch_size.required_on_create = False
+        hec_batch_size.required_on_edit = False
+        scheme.add_argument(hec_batch_size)
+        
+        hec_use_ack = Argument("hec_use_ack")
+        hec_use_ack.title = "HEC Indexer Acknowledgement"
+        hec_use_ack.data_type = Argument.data_type_boolean
+        hec_use_ack.description = "When set to True, the run waits for HEC to acknowledge that every batch was indexed, and sends unacknowledged batches again once. The HEC token must have indexer acknowledgement enabled. Defaults to False."
+        hec_use_ack.required_on_create = False
+        hec_use_ack.required_on_edit = False
+        scheme.add_argument(hec_use_ack)
+        
+        hec_ack_timeout = Argument("hec_ack_timeout")
+        hec_ack_timeout.title = "HEC Acknowledgement Timeout"
+        hec_ack_timeout.data_type = Argument.data_type_number
+        hec_ack_timeout.description = "Seconds to wait at the end of a run for the acknowledgement of the batches sent to HEC. Defaults to 60."
+        hec_ack_timeout.required_on_create = False
+        hec_ack_timeout.required_on_edit = False
+        scheme.add_argument(hec_ack_timeout)
+        
+        hec_verify_ssl = Argument("hec_verify_ssl")
+        hec_verify_ssl.title = "HEC Verify SSL"
+        hec_verify_ssl.data_type = Argument.data_type_boolean
+        hec_verify_ssl.description = "When set to False, the TLS certificate of HEC is not verified. Defaults to True."
+        hec_verify_ssl.required_on_create = False
+        hec_verify_ssl.required_on_edit = False
+        scheme.add_argument(hec_verify_ssl)
+        
+        max_workers = Argument("max_workers")
+        max_workers.title = "Max Workers"
+        max_workers.data_type = Argument.data_type_number
+        max_workers.description = "Number of Assessment Details (export) API calls performed in parallel. Defaults to 1 (sequential)."
+        max_workers.required_on_create = False
+        max_workers.required_on_edit = False
+        scheme.add_argument(max_workers)
+        
+        incremental_mode = Argument("incremental_mode")
+        incremental_mode.title = "Incremental Mode"
+        incremental_mode.data_type = Argument.data_type_boolean
+        incremental_mode.description = "When set to True, Assessment Details are only collected for assessments that are new or whose lastUpdated changed since the previous run. Defaults to True."
+        incremental_mode.required_on_create = False
+        incremental_mode.required_on_edit = False
+        scheme.add_argument(incremental_mode)
+        
+        resume_interrupted_runs = Argument("resume_interrupted_runs")
+        resume_interrupted_runs.title = "Resume Interrupted Runs"
+        resume_interrupted_runs.data_type = Argument.data_type_boolean
+        resume_interrupted_runs.description = "When set to True, the progress of a run is recorded in the checkpoint directory and a run that did not complete is resumed by the next run instead of starting again from page 0. Defaults to True."
+        resume_interrupted_runs.required_on_create = False
+        resume_interrupted_runs.required_on_edit = False
+        scheme.add_argument(resume_interrupted_runs)
+        
+        max_run_seconds = Argument("max_run_seconds")
+        max_run_seconds.title = "Maximum Run Duration"
+        max_run_seconds.data_type = Argument.data_type_number
+        max_run_seconds.description = "Time budget of a run in seconds, usually the input interval. Close to the budget no new Assessment Details export is started and the remaining assessments are exported first by the next run. Defaults to 0 (no budget)."
+        max_run_seconds.required_on_create = False
+        max_run_seconds.required_on_edit = False
+        scheme.add_argument(max_run_seconds)
+        
+        collect_run_metrics = Argument("collect_run_metrics")
+        collect_run_metrics.title = "Collect Run Metrics"
+        collect_run_metrics.data_type = Argument.data_type_boolean
+        collect_run_metrics.description = "When set to True, every run writes one onetrust:collector:metrics event with its API latencies, bytes downloaded, events written per sourcetype, retries, error responses and peak memory. Defaults to True."
+        collect_run_metrics.required_on_create = False
+        collect_run_metrics.required_on_edit = False
+        scheme.add_argument(collect_run_metrics)
+        
+        profile_mode = Argument("profile_mode")
+        profile_mode.title = "Profile Mode"
+        profile_mode.data_type = Argument.data_type_string
+        profile_mode.description = "Profiles the run to diagnose slowness: 'cprofile' for the deterministic profiler of the main thread, 'sampling' for a statistical profiler of all threads that are not waiting for work, or 'off'. The profile is written to the checkpoint directory and the top functions are logged. Defaults to 'off'."
+        profile_mode.required_on_create = False
+        profile_mode.required_on_edit = False
+        scheme.add_argument(profile_mode)
+        
+        profile_top_n = Argument("profile_top_n")
+        profile_top_n.title = "Profile Top Functions"
+        profile_top_n.data_type = Argument.data_type_number
+        profile_top_n.description = "Number of functions with the highest cumulative time logged when profile_mode is set. Defaults to 20."
+        profile_top_n.required_on_create = False
+        profile_top_n.required_on_edit = False
+        scheme.add_argument(profile_top_n)
+        
+        export_order = Argument("export_order")
+        export_order.title = "Export Order"
+        export_order.data_type = Argument.data_type_string
+        export_order.description = "Order of the Assessment Details exports: 'api' for the Assessment Summary page order, or 'recent' for the most recently updated assessments first, after the boosts of export_boosts. Ignored in pipeline mode. Defaults to 'api'."
+        export_order.required_on_create = False
+        export_order.required_on_edit = False
+        scheme.add_argument(export_order)
+        
+        export_boosts = Argument("export_boosts")
+        export_boosts.title = "Export Boosts"
+        export_boosts.data_type = Argument.data_type_string
+        export_boosts.description = "JSON object of boosts applied with export_order 'recent', e.g. {\"status\": {\"UNDER_REVIEW\": 10}, \"residualRiskScore\": 1}. Assessments with a higher status boost plus weighted residual risk score are exported first."
+        export_boosts.required_on_create = False
+        export_boosts.required_on_edit = False
+        scheme.add_argument(export_boosts)
+        
+        export_cache_max_bytes = Argument("export_cache_max_bytes")
+        export_cache_max_bytes.title = "Export Cache Size"
+        export_cache_max_bytes.data_type = Argument.data_type_number
+        export_cache_max_bytes.description = "Size in bytes of the on-disk cache of compressed Assessment Details payloads kept in the checkpoint directory. The cache is shared by the inputs of the checkpoint directory and the size applies to all of them, use the same value on every input. Least recently used payloads are evicted first. Defaults to 0 (disabled)."
+        export_cache_max_bytes.required_on_create = False
+        export_cache_max_bytes.required_on_edit = False
+        scheme.add_argument(export_cache_max_bytes)
+        
+        pipeline_mode = Argument("pipeline_mode")
+        pipeline_mode.title = "Pipeline Mode"
+        pipeline_mode.data_type = Argument.data_type_boolean
+        pipeline_mode.description = "When set to True, Assessment Summary pages are retrieved in the background and their assessments are handed to the Assessment Details collection through a bounded queue, instead of collecting all summaries first. Defaults to False."
+        pipeline_mode.required_on_create = False
+        pipeline_mode.required_on_edit = False
+        scheme.add_argument(pipeline_mode)
+        
+        pipeline_queue_size = Argument("pipeline_queue_size")
+        pipeline_queue_size.title = "Pipeline Queue Size"
+        pipeline_queue_size.data_type = Argument.data_type_number
+        pipeline_queue_size.description = "Maximum number of assessments waiting between the Assessment Summary and the Assessment Details collection in Pipeline Mode. Defaults to 1000."
+        pipeline_queue_size.required_on_create = False
+        pipeline_queue_size.required_on_edit = False
+        scheme.add_argument(pipeline_queue_size)
+        
+        page_workers = Argument("page_workers")
+        page_workers.title = "Page Workers"
+        page_workers.data_type = Argument.data_type_number
+        page_workers.description = "Number of Assessment Summary pages retrieved in parallel once the total number of pages is known. Defaults to 1 (sequential)."
+        page_workers.required_on_create = False
+        page_workers.required_on_edit = False
+        scheme.add_argument(page_workers)
+        
+        stream_summary_pages = Argument("stream_summary_pages")
+        stream_summary_pages.title = "Stream Summary Pages"
+        stream_summary_pages.data_type = Argument.data_type_boolean
+        stream_summary_pages.description = "When set to True, Assessment Summary pages retrieved sequentially are decoded incrementally and each assessment is written as soon as it is parsed, instead of decoding the whole 2000-item page at once. Defaults to False."
+        stream_summary_pages.required_on_create = False
+        stream_summary_pages.required_on_edit = False
+        scheme.add_argument(stream_summary_pages)
+        
+        http_pool_connections = Argument("http_pool_connections")
+        http_pool_connections.title = "HTTP Pool Connections"
+        http_pool_connections.data_type = Argument.data_type_number
+        http_pool_connections.description = "Number of per-host connection pools kept by the HTTP session. Defaults to 10."
+        http_pool_connections.required_on_create = False
+        http_pool_connections.required_on_edit = False
+        scheme.add_argument(http_pool_connections)
+        
+        http_pool_maxsize = Argument("http_pool_maxsize")
+        http_pool_maxsize.title = "HTTP Pool Max Size"
+        http_pool_maxsize.data_type = Argument.data_type_number
+        http_pool_maxsize.description = "Maximum number of keep-alive connections kept open per host. Defaults to the greater of 10 and Max Workers plus Page Workers."
+        http_pool_maxsize.required_on_create = False
+        http_pool_maxsize.required_on_edit = False
+        scheme.add_argument(http_pool_maxsize)
+        
+        http_connect_timeout = Argument("http_connect_timeout")
+        http_connect_timeout.title = "HTTP Connect Timeout"
+        http_connect_timeout.data_type = Argument.data_type_number
+        http_connect_timeout.description = "Seconds to wait for a connection to the OneTrust API before the call is retried. 0 waits indefinitely. Defaults to 10."
+        http_connect_timeout.required_on_create = False
+        http_connect_timeout.required_on_edit = False
+        scheme.add_argument(http_connect_timeout)
+        
+        http_read_timeout = Argument("http_read_timeout")
+        http_read_timeout.title = "HTTP Read Timeout"
+        http_read_timeout.data_type = Argument.data_type_number
+        http_read_timeout.description = "Seconds to wait for data from the OneTrust API, between two reads of a response, before the call is retried. Applies to Assessment Summary pages and Assessment Details exports. 0 waits indefinitely. Defaults to 120."
+        http_read_timeout.required_on_create = False
+        http_read_timeout.required_on_edit = False
+        scheme.add_argument(http_read_timeout)
+        
+        max_calls_per_sec = Argument("max_calls_per_sec")
+        max_calls_per_sec.title = "Max Calls Per Second"
+        max_calls_per_sec.data_type = Argument.data_type_number
+        max_calls_per_sec.description = "Ceiling of OneTrust API calls per second for this tenant. The rate is lowered automatically when the API answers with 429 and recovers afterwards. Fractional values such as 0.5 are allowed. Defaults to 0 (no ceiling until the first 429, the rate observed then becomes the ceiling)."
+        max_calls_per_sec.required_on_create = False
+        max_calls_per_sec.required_on_edit = False
+        scheme.add_argument(max_calls_per_sec)
+        
+        list_retry_attempts = Argument("list_retry_attempts")
+        list_retry_attempts.title = "Summary Retry Attempts"
+        list_retry_attempts.data_type = Argument.data_type_number
+        list_retry_attempts.description = "Number of attempts for an Assessment Summary page on 5xx responses and connection errors before the run is aborted. Defaults to 3."
+        list_retry_attempts.required_on_create = False
+        list_retry_attempts.required_on_edit = False
+        scheme.add_argument(list_retry_attempts)
+        
+        export_retry_attempts = Argument("export_retry_attempts")
+        export_retry_attempts.title = "Details Retry Attempts"
+        export_retry_attempts.data_type = Argument.data_type_number
+        export_retry_attempts.description = "Number of attempts for an Assessment Details (export) call on 5xx responses and connection errors before the assessment is skipped. Defaults to 3."
+        export_retry_attempts.required_on_create = False
+        export_retry_attempts.required_on_edit = False
+        scheme.add_argument(export_retry_attempts)
+        
+        retry_base_delay = Argument("retry_base_delay")
+        retry_base_delay.title = "Retry Base Delay"
+        retry_base_delay.data_type = Argument.data_type_number
+        retry_base_delay.description = "Delay in seconds before the first retry, doubled on every further attempt. Defaults to 1."
+        retry_base_delay.required_on_create = False
+        retry_base_delay.required_on_edit = False
+        scheme.add_argument(retry_base_delay)
+        
+        retry_max_delay = Argument("retry_max_delay")
+        retry_max_delay.title = "Retry Max Delay"
+        retry_max_delay.data_type = Argument.data_type_number
+        retry_max_delay.description = "Maximum delay in seconds between two attempts. Defaults to 30."
+        retry_max_delay.required_on_create = False
+        retry_max_delay.required_on_edit = False
+        scheme.add_argument(retry_max_delay)
+        
+        retry_jitter = Argument("retry_jitter")
+        retry_jitter.title = "Retry Jitter"
+        retry_jitter.data_type = Argument.data_type_number
+        retry_jitter.description = "Share (0 to 1) of each retry delay that is randomized. Defaults to 0.5."
+        retry_jitter.required_on_create = False
+        retry_jitter.required_on_edit = False
+        scheme.add_argument(retry_jitter)
+        
         return scheme
     
     def validate_input(self, definition):
         pass
     
-    def encrypt_keys(self, _base_url, _api_token, _session_key):
+    def get_int_input_item(self, _name, _default):
+
+        value = self.input_items.get(_name)
+        if value is None or str(value).strip() == "":
+            return _default
+        try:
+            return int(str(value).strip())
+        except ValueError:
+            return _default
+    
+    def get_float_input_item(self, _name, _default):
+
+        value = self.input_items.get(_name)
+        if value is None or str(value).strip() == "":
+            return _default
+        try:
+            return float(str(value).strip())
+        except ValueError:
+            return _default
+    
+    def get_bool_input_item(self, _name, _default):
+
+        value = self.input_items.get(_name)
+        if value is None or str(value).strip() == "":
+            return _default
+        return str(value).strip().lower() in ("1", "true", "t", "yes", "y")
+    
+    def credential_name(self, _base_url):
 
-        args = {'token': _session_key}
-        service = client.connect(**args)
+        # Storage passwords are named <realm>:<username>: with the colons of each part escaped.
+        # Credentials are stored without a realm
+        return ":" + _base_url.replace(":", "\\:") + ":"
 
-        credentials = {"baseUrl": _base_url, "apiToken": _api_token}
+    def encrypt_keys(self, _base_url, _api_token):
+
+        # Reuses the splunkd connection of the modular input instead of opening a new one
+        storage_passwords = self.service.storage_passwords
+
+        credentials = json.dumps({"baseUrl": _base_url, "apiToken": _api_token})
 
         try:
-            for storage_password in service.storage_passwords:
-                if storage_password.username == _base_url:
-                    service.storage_passwords.delete(username=storage_password.username)
-                    break
+            try:
+                storage_passwords.delete(self.credential_name(_base_url))
+            except KeyError:
+                pass
 
-            service.storage_passwords.create(json.dumps(credentials), _base_url)
+            storage_passwords.create(credentials, _base_url)
+            self.credential_cache[_base_url] = credentials
 
         except Exception as e:
             raise Exception("Error encrypting: %s" % str(e))
     
-    def decrypt_keys(self, _base_url, _session_key):
+    def decrypt_keys(self, _base_url):
 
-        args = {'token': _session_key}
-        service = client.connect(**args)
+        if _base_url in self.credential_cache:
+            return self.credential_cache[_base_url]
 
-        for storage_password in service.storage_passwords:
-            if storage_password.username == _base_url:
-                return storage_password.content.clear_password
+        try:
+            storage_password = self.service.storage_passwords[self.credential_name(_base_url)]
+        except KeyError:
+            return None
 
-    def mask_credentials(self, _base_url, _api_token, _input_name, _session_key):
+        credentials = storage_password.content.clear_password
+        self.credential_cache[_base_url] = credentials
+        return credentials
 
-        try:
-            args = {"token": _session_key}
-            service = client.connect(**args)
+    def mask_credentials(self, _base_url, _api_token, _input_name):
 
-            kind, _input_name = _input_name.split("://")
-            item = service.inputs.__getitem__((_input_name, kind))
+        kwargs = {
+            "base_url": _base_url,
+            "api_token": self.MASK
+        }
 
-            kwargs = {
-                "base_url": _base_url,
-                "api_token": self.MASK
-            }
+        self.update_input(_input_name, kwargs)
+
+    def update_input(self, _input_name, _kwargs):
+
+        try:
+            kind, _input_name = _input_name.split("://")
+            item = self.service.inputs.__getitem__((_input_name, kind))
 
-            item.update(**kwargs).refresh()
+            item.update(**_kwargs).refresh()
 
         except Exception as e:
             raise Exception("Error updating inputs.conf: %s" % str(e))
     
-    def get_assessment_list(self, ew, _base_url, _api_token, _archival_state, _page):
-        
-        url = f"{_base_url}/api/assessment/v2/assessments?assessmentArchivalState={_archival_state}&size=2000&page={_page}"
-
-        ew.log("INFO", f"OneTrust API Call: GET {url}")
+    def build_http_session(self, _api_token, _pool_connections, _pool_maxsize):
 
-        headers = {
+        # One keep-alive session per run and tenant, so that the bearer header is applied once
+        # and TCP/TLS connections are reused across all summary and export calls
+        session = requests.Session()
+        session.headers.update({
             "Accept": "application/json",
             "Content-Type": "application/json",
             "Authorization": f"Bearer {_api_token}"
-        }
+        })
+
+        adapter = HTTPAdapter(pool_connections=_pool_connections, pool_maxsize=_pool_maxsize)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+        return session
+    
+    def api_get(self, ew, _session, _url, _retry_policy, _stream=False):
+
+        attempt = 1
+
+        while True:
+            try:
+                response = self.api_get_rate_limited(ew, _session, _url, _stream)
+                if response.status_code not in _retry_policy.RETRY_STATUS_CODES or attempt >= _retry_policy.attempts:
+                    return response
+                response.close()
+                reason = f"request_status_code={str(response.status_code)}"
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self.metrics.observe_connection_error()
+                if attempt >= _retry_policy.attempts:
+                    raise
+                reason = f"err_msg=\"{str(e)}\""
+
+            delay = _retry_policy.delay(attempt)
+            _retry_policy.record_retry()
+            ew.log("WARN", f"API call failed with {reason}. Retrying in {str(round(delay, 2))} s, attempt {str(attempt + 1)} of {str(_retry_policy.attempts)}. url={_url}")
+            time.sleep(delay)
+            attempt += 1
+
+    def api_get_rate_limited(self, ew, _session, _url, _stream):
+
+        rate_limit_retries = 0
+
+        while True:
+            self.throttler.acquire()
+            response = _session.get(_url, stream=_stream, timeout=self.request_timeout)
+            self.metrics.observe_response(response.status_code)
+            if response.status_code != 429:
+                self.throttler.on_success()
+                return response
+            if rate_limit_retries >= self.RATE_LIMIT_MAX_RETRIES:
+                return response
+            response.close()
+            rate_limit_retries += 1
+            retry_after = parse_retry_after(response.headers.get("Retry-After"), self.RATE_LIMIT_DEFAULT_WAIT)
+            self.throttler.on_rate_limited(retry_after)
+            ew.log("WARN", f"API call was rate limited (request_status_code=429). Retrying in {str(round(retry_after, 2))} s, attempt {str(rate_limit_retries)} of {str(self.RATE_LIMIT_MAX_RETRIES)}. url={_url}")
+    
+    def get_assessment_list(self, ew, _base_url, _session, _archival_state, _page):
+        
+        url = f"{_base_url}/api/assessment/v2/assessments?assessmentArchivalState={_archival_state}&size=2000&page={_page}"
+
+        ew.log("INFO", f"OneTrust API Call: GET {url}")
 
         try:
-            response = requests.get(url, headers=headers)
+            requestStart = time.perf_counter()
+            response = self.api_get(ew, _session, url, self.list_retry_policy)
             if response.status_code != 200:
+                self.list_retry_policy.record_failure()
                 ew.log("ERROR", f"API call returned request_status_code={str(response.status_code)}. Failed to retrieve Assessment Summary from {_base_url}.")
                 sys.exit(1)
             
-            return response.json()
+            assessmentList = response.json()
+            self.metrics.observe_page(time.perf_counter() - requestStart, len(response.content))
+            return assessmentList
         except Exception as e:
+            self.list_retry_policy.record_failure()
             ew.log("ERROR", f"Error retrieving 2000 Assessment IDs from page={str(_page)}. err_msg=\"{str(e)}\"")
             sys.exit(1)
 
-    def get_assessment_details(self, ew, _base_url, _api_token, _assessmentId):
+    def stream_assessment_list(self, ew, _base_url, _session, _archival_state, _page, _page_info):
         
-        url = f"{_base_url}/api/assessment/v2/assessments/{_assessmentId}/export?ExcludeSkippedQuestions=true"
+        url = f"{_base_url}/api/assessment/v2/assessments?assessmentArchivalState={_archival_state}&size=2000&page={_page}"
 
-        headers = {
-            "Accept": "application/json",
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {_api_token}"
-        }
+        ew.log("INFO", f"OneTrust API Call: GET {url}")
 
         try:
-            response = requests.get(url, headers=headers)
+            requestStart = time.perf_counter()
+            response = self.api_get(ew, _session, url, self.list_retry_policy, _stream=True)
+            requestElapsed = time.perf_counter() - requestStart
             if response.status_code != 200:
+                response.close()
+                self.list_retry_policy.record_failure()
+                ew.log("ERROR", f"API call returned request_status_code={str(response.status_code)}. Failed to retrieve Assessment Summary from {_base_url}.")
+                sys.exit(1)
+        except Exception as e:
+            self.list_retry_policy.record_failure()
+            ew.log("ERROR", f"Error retrieving 2000 Assessment IDs from page={str(_page)}. err_msg=\"{str(e)}\"")
+            sys.exit(1)
+
+        # Assessments are yielded as soon as they are decoded from the response body. The page latency
+        # only counts the time spent waiting for the body, not the time spent on its assessments
+        try:
+            meter = [requestElapsed, 0]
+            stream = JsonArrayStream(metered_chunks(response.iter_content(chunk_size=self.STREAM_CHUNK_SIZE), meter))
+            for assessmentItem in stream.iter_object_array("content", _page_info):
+                yield assessmentItem
+            self.metrics.observe_page(meter[0], meter[1])
+        except Exception as e:
+            self.list_retry_policy.record_failure()
+            ew.log("ERROR", f"Error retrieving 2000 Assessment IDs from page={str(_page)}. err_msg=\"{str(e)}\"")
+            sys.exit(1)
+        finally:
+            response.close()
+
+    def get_assessment_details(self, ew, _base_url, _session, _assessmentId):
+        
+        url = f"{_base_url}/api/assessment/v2/assessments/{_assessmentId}/export?ExcludeSkippedQuestions=true"
+
+        try:
+            requestStart = time.perf_counter()
+            response = self.api_get(ew, _session, url, self.export_retry_policy)
+            if response.status_code != 200:
+                self.export_retry_policy.record_failure()
                 ew.log("ERROR", f"API call returned request_status_code={str(response.status_code)}. Failed to retrieve assessment detail of {_assessmentId} from {_base_url}. Moving on to next Assessment ID instead.")
                 return None
             else:
-                return response.json()
+                fullAssDetail = response.json()
+                self.metrics.observe_export(time.perf_counter() - requestStart, len(response.content))
+                return fullAssDetail
         except Exception as e:
+            self.export_retry_policy.record_failure()
             ew.log("ERROR", f"Error retrieving Assessment detail of {_assessmentId}. err_msg=\"{str(e)}\"")
             return None
 
     def assessment_json_bldr(self, ew, _data):
-        assessmentJsonRetVal = {}
-
-        assessmentJsonRetVal['assessmentId'] = self.NO_JSON_DATA
-        if 'assessmentId' in _data:
-            assessmentJsonRetVal['assessmentId'] = _data['assessmentId']
-
-        assessmentJsonRetVal['assessmentNumber'] = self.NO_JSON_DATA
-        if 'assessmentNumber' in _data:
-            assessmentJsonRetVal['assessmentNumber'] = _data['assessmentNumber']
-
-        assessmentJsonRetVal['lastUpdated'] = self.NO_JSON_DATA
-        if 'lastUpdated' in _data:
-            assessmentJsonRetVal['lastUpdated'] = _data['lastUpdated']
-
-        assessmentJsonRetVal['submittedOn'] = self.NO_JSON_DATA
-        if 'lastUpdated' in _data:
-            assessmentJsonRetVal['submittedOn'] = _data['submittedOn']
-
-        assessmentJsonRetVal['completedOn'] = self.NO_JSON_DATA
-        if 'completedOn' in _data:
-            assessmentJsonRetVal['completedOn'] = _data['completedOn']
-
-        assessmentJsonRetVal['createdDT'] = self.NO_JSON_DATA
-        if 'createdDT' in _data:
-            assessmentJsonRetVal['createdDT'] = _data['createdDT']
-
-        assessmentJsonRetVal['template'] = self.NO_JSON_DATA
-        if 'template' in _data:
-            if 'name' in _data['template']:
-                assessmentJsonRetVal['templateName'] = _data['template']['name']
-
-        assessmentJsonRetVal['title'] = self.NO_JSON_DATA
-        if 'name' in _data:
-            assessmentJsonRetVal['title'] = _data['name']
-
-        assessmentJsonRetVal['orgGroup'] = self.NO_JSON_DATA
-        if 'orgGroup' in _data:
-            if 'name' in _data['orgGroup']:
-                assessmentJsonRetVal['orgGroup'] = _data['orgGroup']['name']
-
-        assessmentJsonRetVal['createdBy'] = self.NO_JSON_DATA
-        if 'createdBy' in _data:
-            if 'name' in _data['createdBy']:
-                assessmentJsonRetVal['createdBy'] = _data['createdBy']['name']
-
-        assessmentJsonRetVal['responseTitle'] = self.NO_JSON_DATA
-        if 'sections' in _data:
-            if len(_data['sections']) > 0:
-                if 'questions' in _data['sections'][0]:
-                    for question in _data['sections'][0]['questions']:
-                        if 'content' in question['question']:
-                            if question['question']['content'] == 'Please provide a request title':
-                                if len(question['questionResponses']) > 0:
-                                    if len(question['questionResponses'][0]['responses']) > 0:
-                                        assessmentJsonRetVal['responseTitle'] = question['questionResponses'][0]['responses'][0]['response']
-                                        break
-
-        assessmentJsonRetVal['approvalInfo'] = []
-        if 'approvers' in _data:
-            for approvers in _data['approvers']:
-                assessmentJsonRetVal['approvalInfo'].append({
-                    "approvers": approvers['approver']['fullName'], 
-                    "approvedOn": approvers['approvedOn'], 
-                    "approverResult": approvers['resultName']
-                    })
-
-        assessmentJsonRetVal['respondent'] = self.NO_JSON_DATA
-        if 'respondent' in _data:
-            if 'name' in _data['respondent']:
-                assessmentJsonRetVal['respondent'] = _data['respondent']['name']
-        
-        assessmentJsonRetVal['respondents'] = self.NO_JSON_DATA
-        if 'respondents' in _data:
-            respondent_names = [r['name'] for r in _data['respondents']]
-            assessmentJsonRetVal['respondents'] = respondent_names
-
-        assessmentJsonRetVal['status'] = self.NO_JSON_DATA
-        if 'status' in _data:
-            assessmentJsonRetVal['status'] = _data['status']
-
-        assessmentJsonRetVal['result'] = self.NO_JSON_DATA
-        if 'result' in _data:
-            assessmentJsonRetVal['result'] = _data['result']
-
-        assessmentJsonRetVal['riskLevel'] = self.NO_JSON_DATA
-        if 'residualRiskScore' in _data:
-            assessmentJsonRetVal['riskLevel'] = _data['residualRiskScore']
-        
-        return assessmentJsonRetVal
-
-    def assessment_questions_json_bldr(self, ew, _data):
+        return self.details_bldr(_data)
+
+    def configure_field_projection(self, ew, _field_projection, _count_bytes=False):
+
+        try:
+            projectionSpec = json.loads(_field_projection)
+            if not isinstance(projectionSpec, dict):
+                raise ValueError("the field projection must be a JSON object")
+            fieldProjections = {}
+            for sourcetype, projection in projectionSpec.items():
+                if sourcetype not in self.SOURCETYPES:
+                    raise ValueError(f"unknown sourcetype '{sourcetype}'")
+                if not isinstance(projection, dict) or not all(isinstance(projection.get(k, []), list) for k in ("include", "exclude")):
+                    raise ValueError(f"the projection of '{sourcetype}' must be an object of 'include' and/or 'exclude' lists")
+                fieldProjections[sourcetype] = FieldProjection(projection.get("include"), projection.get("exclude"), _count_bytes)
+            self.field_projections = fieldProjections
+            self.field_projection_spec = projectionSpec
+        except ValueError as e:
+            ew.log("ERROR", f"Invalid field_projection, all fields will be written. err_msg=\"{str(e)}\"")
+
+    def compile_details_field_spec(self, ew, _details_field_spec):
+
+        spec = dict(self.DETAILS_FIELD_SPEC)
+        try:
+            customSpec = json.loads(_details_field_spec)
+            if not isinstance(customSpec, dict):
+                raise ValueError("the spec must be a JSON object")
+            spec.update(customSpec)
+            self.details_bldr = compile_field_spec(spec, self.NO_JSON_DATA)
+            self.details_field_spec = spec
+        except ValueError as e:
+            ew.log("ERROR", f"Invalid details_field_spec, the default Assessment Details fields will be used. err_msg=\"{str(e)}\"")
+
+    def output_fingerprint(self):
+
+        # Settings that shape the events written for an export, recorded with the checkpoint
+        settings = {"qnaEventMode": self.qna_event_mode, "detailsFieldSpec": self.details_field_spec, "fieldProjection": self.field_projection_spec}
+        return hashlib.sha1(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def assessment_events_bldr(self, ew, _data):
+
+        # Walks the sections and questions of the export payload once and returns the Assessment
+        # Details event body, the Questions and Responses event body and the per-question event bodies
+        assessmentJsonRetVal = self.assessment_json_bldr(ew, _data)
         
         questionsRetVal = {}
         questionsRetVal['assessmentId'] = _data['assessmentId']
         questionsRetVal['questionsAndAnswers'] = []
 
+        arrayEvents = self.qna_event_mode != "per_question"
+        questionEvents = []
+        appendQuestionEvent = questionEvents.append if self.qna_event_mode != "array" else None
+
+        # The request title is only looked up in the first section, FAQ or not
+        titlePending = True
+
         if "sections" in _data:
-            for section in _data['sections']:
+            for sectionIndex, section in enumerate(_data['sections']):
+                isFaqSection = False
+                sectionName = "n/a"
                 if "header" in section:
                     if "name" in section['header']:
                         sectionNameContent = section['header']['name']
-                        if re.search("Frequently\sAsked\sQuestions?", sectionNameContent):
-                            continue
-                        questionsRetVal['sectionName'] = sectionNameContent
-                    if "description" in section['header']:
-                        questionsRetVal['description'] = section['header']['description']
-                    if "sequence" in section['header']:
-                        questionsRetVal['sequence'] = section['header']['sequence']
-                if "questions" in section:
-                    for question in section['questions']:
-                        qna = {}
-                        # Question key-val-pair
-                        if "question" in question:
-                            if "content" in question['question']:
-                                qna['question'] = question['question']['content']
-                            if "sequence" in question['question']:
-                                qna['questionSeq'] = question['question']['sequence']
+                        if self.FAQ_SECTION_PATTERN.search(sectionNameContent):
+                            isFaqSection = True
+                        else:
+                            questionsRetVal['sectionName'] = sectionNameContent
+                            sectionName = sectionNameContent
+                    if not isFaqSection:
+                        if "description" in section['header']:
+                            questionsRetVal['description'] = section['header']['description']
+                        if "sequence" in section['header']:
+                            questionsRetVal['sequence'] = section['header']['sequence']
+                if "questions" not in section:
+                    continue
+                lookupTitle = titlePending and sectionIndex == 0
+                if isFaqSection and not lookupTitle:
+                    continue
+                appendQnA = questionsRetVal['questionsAndAnswers'].append
+                for question in section['questions']:
+                    questionContent = question.get('question', self.EMPTY_JSON_OBJECT)
+                    
+                    if lookupTitle and titlePending and questionContent.get('content') == self.REQUEST_TITLE_QUESTION and 'responseTitle' in assessmentJsonRetVal:
+                        questionResponses = question.get('questionResponses', ())
+                        if len(questionResponses) > 0 and len(questionResponses[0]['responses']) > 0:
+                            assessmentJsonRetVal['responseTitle'] = questionResponses[0]['responses'][0]['response']
+                            titlePending = False
+                    
+                    if isFaqSection:
+                        continue
+                    
+                    qna = {}
+                    # Question key-val-pair
+                    if "content" in questionContent:
+                        qna['question'] = questionContent['content']
+                    if "sequence" in questionContent:
+                        qna['questionSeq'] = questionContent['sequence']
+                            
+                    # Responses key-val-pair (array)
+                    allResponses = []
+                    if "questionResponses" in question:
+                        for questionResponse in question['questionResponses']:
+                            if "responses" in questionResponse:
+                                for response in questionResponse['responses']:
+                                    if "response" in response:
+                                        allResponses.append(response['response'])
+                    qna['responses'] = allResponses
                                 
-                        # Responses key-val-pair (array)
-                        allResponses = []
-                        defaultResponse = "n/a"
-                        if "questionResponses" in question:
-                            for questionResponse in question['questionResponses']:
-                                if "responses" in questionResponse:
-                                    for response in questionResponse['responses']:
-                                        if "response" in response:
-                                            defaultResponse = response['response']
-                                            allResponses.append(defaultResponse)
-                        qna['responses'] = allResponses
-                                    
-                        questionsRetVal['questionsAndAnswers'].append(qna)
+                    if arrayEvents:
+                        appendQnA(qna)
+
+                    # Key of the question lookup, from the section of the question rather than the last
+                    # section of the assessment. Questions without content are not looked up
+                    if appendQuestionEvent is not None and 'question' in qna:
+                        appendQuestionEvent({
+                            'assessmentId': questionsRetVal['assessmentId'],
+                            'sectionName': sectionName,
+                            'seqNum': qna.get('questionSeq'),
+                            'question': qna['question'],
+                            'responses': allResponses,
+                            'primkey': hashlib.sha256(f"{sectionName}{questionsRetVal['assessmentId']}{qna['question']}".encode("utf-8")).hexdigest()
+                        })
                                     
-        return questionsRetVal
+        return assessmentJsonRetVal, questionsRetVal, questionEvents
 
-    def stream_events(self, inputs, ew):
+    def get_assessment_page(self, ew, _base_url, _session, _archival_state, _page, _stream_page, _page_info):
+
+        # Returns the assessments of a page and fills _page_info with the other members of the page.
+        # A streamed page is only retrieved, and _page_info only filled, once its assessments are consumed
+        if _stream_page:
+            return self.stream_assessment_list(ew, _base_url, _session, _archival_state, _page, _page_info)
+
+        assessment_ids_curpage = self.get_assessment_list(ew, _base_url, _session, _archival_state, _page)
+        for key in assessment_ids_curpage:
+            if key != "content":
+                _page_info[key] = assessment_ids_curpage[key]
+        return assessment_ids_curpage.get("content", [])
+
+    def iter_assessment_pages(self, ew, _base_url, _session, _archival_state, _test_mode, _page_workers, _stream_pages, _skip_pages=(), _first_page_info=None):
+
+        # Assumes there at least 1 page
+        assessment_ids_pages = 1
+
+        # The first page tells the total number of pages, so it is retrieved even when skipped.
+        # The assessments of skipped pages, completed by an interrupted run, are not handed back
+        page_info = {} if _first_page_info is None else _first_page_info
+        if 0 in _skip_pages:
+            self.get_assessment_page(ew, _base_url, _session, _archival_state, 0, False, page_info)
+            yield 0, []
+        else:
+            yield 0, self.get_assessment_page(ew, _base_url, _session, _archival_state, 0, _stream_pages, page_info)
+        if "page" in page_info:
+            if "totalPages" in page_info["page"]:
+                assessment_ids_pages = page_info["page"]["totalPages"]
+                
+        if int(_test_mode) == 1:
+            ew.log("INFO", f"Test mode is enabled, so the collector will only perform GET call for page 0 and will not consume all {assessment_ids_pages} pages for Assessment Summary. Collection of Assessment Details and Questions/Answers will also be skipped, unless test_sample_size is set.")
+            assessment_ids_pages = 1
+
+        remaining_pages = range(1, assessment_ids_pages)
+
+        if _page_workers <= 1:
+            for page_flipper in remaining_pages:
+                if page_flipper in _skip_pages:
+                    yield page_flipper, []
+                    continue
+                yield page_flipper, self.get_assessment_page(ew, _base_url, _session, _archival_state, page_flipper, _stream_pages, {})
+            return
+
+        # Remaining pages are retrieved concurrently but still handed back in page order
+        get_page = lambda _page: [] if _page in _skip_pages else self.get_assessment_page(ew, _base_url, _session, _archival_state, _page, False, {})
+        with concurrent.futures.ThreadPoolExecutor(max_workers=_page_workers) as executor:
+            for page_flipper, content in bounded_ordered_map(executor, get_page, remaining_pages, _page_workers):
+                yield page_flipper, content
+
+    def iter_queued_summary_items(self, ew, _pages, _queue_size):
+
+        # A producer thread pages through the Assessment Summary API and puts every assessment onto
+        # a bounded queue, so that memory is proportional to the queue size instead of the tenant size
+        work_queue = queue.Queue(maxsize=_queue_size)
+        stop = threading.Event()
+        end_of_pages = object()
+
+        def put(_item):
+            while not stop.is_set():
+                try:
+                    work_queue.put(_item, timeout=1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def producer():
+            try:
+                for page_number, content in _pages:
+                    for assessmentItem in content:
+                        if not put((page_number, assessmentItem)):
+                            return
+                put((end_of_pages, None))
+            except BaseException as e:
+                # Includes the SystemExit raised by get_assessment_list, re-raised in the consumer thread
+                put((end_of_pages, e))
+
+        producer_thread = threading.Thread(target=producer, name="onetrust-summary-producer", daemon=True)
+        producer_thread.start()
+
+        try:
+            while True:
+                page_number, assessmentItem = work_queue.get()
+                if page_number is end_of_pages:
+                    if assessmentItem is not None:
+                        raise assessmentItem
+                    return
+                yield page_number, assessmentItem
+        finally:
+            stop.set()
+
+    def write_json_event(self, ew, _sourcetype, _body):
+
+        projection = self.field_projections.get(_sourcetype)
+        if projection is not None:
+            _body = projection.apply(_body)
+
+        data = json.dumps(_body)
+        self.metrics.observe_event(_sourcetype, len(data))
+
+        if self.event_sink is not None:
+            self.event_sink.write(_sourcetype, data)
+            return
+
+        event = Event()
+        event.stanza = self.input_name
+        event.sourceType  = _sourcetype
+        event.data = data
+        ew.write_event(event)
+
+    def write_assessment_summaries(self, ew, _base_url, _apiScriptHost, _summaryItems, _checkpoint, _seenAssessmentIds, _runStats, _runCursor=None, _backlogged=None):
+
+        for page_number, assessmentItem in _summaryItems:
+            if _runCursor is not None:
+                _runCursor.page_started(page_number)
+            assessmentItem["tenantHostname"] = _base_url
+            assessmentItem["apiPage"] = page_number
+            assessmentItem["apiScriptHost"] = _apiScriptHost
+            self.write_json_event(ew, "onetrust:assessment:summary", assessmentItem)
+            _runStats["summaries"] += 1
+
+            if "assessmentId" not in assessmentItem:
+                continue
+            _seenAssessmentIds.add(assessmentItem["assessmentId"])
+            # Checked before the checkpoint, which is seeded with the exports of the interrupted run
+            if _runCursor is not None and _runCursor.is_exported(assessmentItem["assessmentId"], assessmentItem.get("lastUpdated")):
+                _runStats["resumed_exports"] += 1
+                continue
+            if _checkpoint is not None and not _checkpoint.is_changed(assessmentItem["assessmentId"], assessmentItem.get("lastUpdated")):
+                _runStats["skipped_exports"] += 1
+                continue
+            if _backlogged and _backlogged.get(assessmentItem["assessmentId"], _backlogged) == assessmentItem.get("lastUpdated"):
+                # Already in the work list, ahead of the summaries
+                continue
+            if _runCursor is not None:
+                _runCursor.item_started(assessmentItem["assessmentId"], page_number)
+
+            yield AssessmentWorkItem(assessmentItem["assessmentId"], assessmentItem.get("lastUpdated"), assessmentItem.get("templateName"),
+                                     assessmentItem.get("status"), assessmentItem.get("residualRiskScore"))
+
+    def compile_export_priority(self, ew, _export_boosts):
+
+        try:
+            boosts = json.loads(_export_boosts) if _export_boosts else {}
+            if not isinstance(boosts, dict):
+                raise ValueError("the boosts must be a JSON object")
+            return compile_export_priority(boosts)
+        except ValueError as e:
+            ew.log("ERROR", f"Invalid export_boosts, assessments will only be ordered by lastUpdated. err_msg=\"{str(e)}\"")
+            return compile_export_priority({})
+
+    def export_test_sample(self, ew, _base_url, _session, _apiScriptHost, _workList, _pageInfo, _sampleSize, _strategy, _maxWorkers, _pageWorkers, _maxCallsPerSec):
+
+        # Exports a sample of the page 0 assessments one at a time, then extrapolates the duration
+        # and API calls of a full run from the measured page and export latencies and transform cost
+        sample = sample_work_items(_workList, _sampleSize, _strategy, random.Random())
+        ew.log("INFO", f"Sampled test mode is enabled, {str(len(sample))} of the {str(len(_workList))} Assessment(s) of page 0 will be exported to estimate a full run. test_sample_strategy={_strategy}")
+
+        exported = 0
+        transformSeconds = 0.0
+        for assessment in sample:
+            fullAssDetail = self.get_assessment_export(ew, _base_url, _session, assessment)
+            if fullAssDetail is None:
+                continue
+            transformStart = time.perf_counter()
+            self.write_assessment_detail_events(ew, _base_url, _apiScriptHost, assessment, fullAssDetail)
+            transformSeconds += time.perf_counter() - transformStart
+            exported += 1
+
+        if exported == 0:
+            ew.log("WARN", "No sampled Assessment could be exported, a full run cannot be estimated.")
+            return
+
+        pageSummary = _pageInfo.get("page", {})
+        totalPages = pageSummary.get("totalPages", 1)
+        totalAssessments = pageSummary.get("totalElements", len(_workList) * totalPages)
+        metrics = self.metrics
+        pageLatency = sum(metrics.page_latencies) / max(1, len(metrics.page_latencies))
+        exportLatency = sum(metrics.export_latencies) / max(1, len(metrics.export_latencies))
+        transformPerAssessment = transformSeconds / exported
+
+        # Exports overlap across workers while the events are built by one thread, the slower bounds the run
+        listSeconds = totalPages * pageLatency / _pageWorkers
+        exportSeconds = totalAssessments * max(exportLatency / _maxWorkers, transformPerAssessment)
+        if _maxCallsPerSec > 0:
+            exportSeconds = max(exportSeconds, totalAssessments / _maxCallsPerSec)
+
+        summaryBytes = metrics.event_bytes["onetrust:assessment:summary"] / max(1, metrics.events["onetrust:assessment:summary"])
+        detailBytes = (metrics.event_bytes["onetrust:assessment:details"] + metrics.event_bytes["onetrust:assessment:qna"] + metrics.event_bytes["onetrust:assessment:question"]) / exported
+
+        estimate = {
+            "sampleSize": exported,
+            "sampleStrategy": _strategy,
+            "totalAssessments": totalAssessments,
+            "totalPages": totalPages,
+            "apiCalls": totalPages + totalAssessments,
+            "durationSeconds": round(listSeconds + exportSeconds, 1),
+            "listSeconds": round(listSeconds, 1),
+            "exportSeconds": round(exportSeconds, 1),
+            "exportLatencyMs": round(exportLatency * 1000, 1),
+            "transformMsPerAssessment": round(transformPerAssessment * 1000, 3),
+            "eventBytes": int(totalAssessments * (summaryBytes + detailBytes)),
+            "maxWorkers": _maxWorkers,
+            "pageWorkers": _pageWorkers
+        }
+        metrics.full_run_estimate = estimate
+        ew.log("INFO", f"Full run estimate from {str(exported)} sampled export(s): duration_s={str(estimate['durationSeconds'])} api_calls={str(estimate['apiCalls'])} total_assessments={str(totalAssessments)} total_pages={str(totalPages)} export_latency_ms={str(estimate['exportLatencyMs'])} transform_ms={str(estimate['transformMsPerAssessment'])} event_bytes={str(estimate['eventBytes'])} max_workers={str(_maxWorkers)} page_workers={str(_pageWorkers)}")
+
+    def iter_backlog_items(self, ew, _backlog, _runCursor, _runStats):
+
+        for assessment in _backlog.assessments:
+            if _runCursor is not None:
+                if _runCursor.is_exported(assessment.assessmentId, assessment.lastUpdated):
+                    _runStats["resumed_exports"] += 1
+                    continue
+                # Backlog items are exported before any summary page
+                _runCursor.item_started(assessment.assessmentId, 0)
+            yield assessment
+
+    def iter_within_budget(self, ew, _assessments, _deadline, _deferred):
+
+        # Once the deadline has passed no new export is started, the remaining assessments are deferred
+        for assessment in _assessments:
+            if time.time() < _deadline:
+                yield assessment
+            else:
+                _deferred.append(assessment)
+
+    def get_assessment_export(self, ew, _base_url, _session, _assessment):
+
+        assessmentId = _assessment.assessmentId
+        lastUpdated = _assessment.lastUpdated
+        if self.export_cache is None or lastUpdated is None:
+            return self.get_assessment_details(ew, _base_url, _session, assessmentId)
+
+        fullAssDetail = self.export_cache.get(_base_url, assessmentId, lastUpdated)
+        if fullAssDetail is not None:
+            return fullAssDetail
+
+        fullAssDetail = self.get_assessment_details(ew, _base_url, _session, assessmentId)
+        if fullAssDetail is not None:
+            try:
+                self.export_cache.put(_base_url, assessmentId, lastUpdated, fullAssDetail)
+            except OSError as e:
+                ew.log("WARN", f"Unable to cache Assessment detail of {assessmentId}. err_msg=\"{str(e)}\"")
+        return fullAssDetail
+
+    def fetch_assessment_details(self, ew, _base_url, _session, _assessments, _max_workers):
+
+        if _max_workers <= 1:
+            for assessment in _assessments:
+                yield assessment, self.get_assessment_export(ew, _base_url, _session, assessment)
+            return
+
+        # Keep a bounded number of exports in flight and hand the results back in work-list order,
+        # so that events are still written by a single EventWriter in a deterministic order
+        get_details = lambda _assessment: self.get_assessment_export(ew, _base_url, _session, _assessment)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=_max_workers) as executor:
+            for assessment, fullAssDetail in bounded_ordered_map(executor, get_details, _assessments, _max_workers * 2):
+                yield assessment, fullAssDetail
+
+    def write_assessment_detail_events(self, ew, _base_url, _apiScriptHost, _assessment, _fullAssDetail):
+
+        trimmedAssDetail, trimmedAssQnA, questionEvents = self.assessment_events_bldr(ew, _fullAssDetail)
+        trimmedAssDetail["tenantHostname"] = _base_url
+        trimmedAssDetail["apiScriptHost"] = _apiScriptHost
+        self.write_json_event(ew, "onetrust:assessment:details", trimmedAssDetail)
         
-        start = time.time()
+        # Streaming Question and Responses
+        assLastUpdated = "n/a"
+        if _assessment.lastUpdated is not None:
+            assLastUpdated = _assessment.lastUpdated
+        assTemplate = "n/a"
+        if _assessment.templateName is not None:
+            assTemplate = _assessment.templateName
+        if self.qna_event_mode != "per_question":
+            trimmedAssQnA["lastUpdated"] = assLastUpdated
+            trimmedAssQnA["templateName"] = assTemplate
+            self.write_json_event(ew, "onetrust:assessment:qna", trimmedAssQnA)
+        for questionEvent in questionEvents:
+            questionEvent["lastUpdated"] = assLastUpdated
+            self.write_json_event(ew, "onetrust:assessment:question", questionEvent)
+
+    def write_run_metrics(self, ew, _base_url, _elapsed, _runFailed, _runCursor, _runStats):
+
+        metrics = self.metrics.to_event()
+        metrics["runId"] = _runCursor.run_id if _runCursor is not None else None
+        metrics["status"] = "failed" if _runFailed else "completed"
+        metrics["elapsedSeconds"] = round(_elapsed, 3)
+        metrics["exports"]["skipped"] = _runStats["skipped_exports"]
+        metrics["exports"]["resumed"] = _runStats["resumed_exports"]
+        metrics["exports"]["cacheHits"] = self.export_cache.hits if self.export_cache is not None else 0
+        metrics["retries"] = {"list": self.list_retry_policy.retries, "export": self.export_retry_policy.retries}
+        metrics["failures"] = {"list": self.list_retry_policy.failures, "export": self.export_retry_policy.failures}
+        metrics["rateLimitedResponses"] = self.throttler.rate_limited
+        metrics["tenantHostname"] = _base_url
+        metrics["apiScriptHost"] = socket.gethostname()
+        self.write_json_event(ew, "onetrust:collector:metrics", metrics)
+
+    def open_hec_sink(self, ew, _hec_url, _hec_token, _batch_size, _use_ack, _ack_timeout, _verify, _retry_policy):
+
+        # The HEC token is stored encrypted like the API token, under the name of the HEC URL
+        if _hec_token and _hec_token != self.MASK:
+            self.encrypt_keys(_hec_url, _hec_token)
+            self.update_input(self.input_name, {"hec_token": self.MASK})
+
+        decrypted = self.decrypt_keys(_hec_url)
+        if decrypted is None:
+            raise Exception(f"No HEC token stored for hec_url={_hec_url}")
+        hec_token = str(json.loads(decrypted)["apiToken"]).strip()
+
+        metadata = {"source": self.input_name, "host": self.input_items.get("host"), "index": self.input_items.get("index")}
+        self.event_sink = HecEventSink(ew, _hec_url, hec_token, _batch_size, _retry_policy, _use_ack, _ack_timeout, _verify, metadata, self.request_timeout)
+        ew.log("INFO", f"Events are sent to HEC instead of splunkd. hec_url={_hec_url} hec_batch_size={str(_batch_size)} hec_use_ack={str(_use_ack)}")
+
+    def save_run_cursor(self, ew, _runCursor):
+
+        # The events of the assessments recorded as exported must be written out before the cursor
+        try:
+            ew.flush()
+            if self.event_sink is not None:
+                self.event_sink.flush()
+            _runCursor.save()
+        except HecDeliveryError:
+            raise
+        except Exception as e:
+            ew.log("ERROR", f"Unable to write run cursor file={_runCursor.path}. err_msg=\"{str(e)}\"")
+
+    def stream_events(self, inputs, ew):
 
         self.input_name, self.input_items = inputs.inputs.popitem()
-        session_key = self._input_definition.metadata["session_key"]
+
+        profile_mode = str(self.input_items.get("profile_mode") or "off").strip().lower()
+        if profile_mode in ("off", "0", "false"):
+            return self.stream_input_events(ew)
+
+        if profile_mode == "cprofile":
+            profiler = cProfile.Profile()
+        elif profile_mode == "sampling":
+            profiler = SamplingProfiler(self.PROFILE_SAMPLE_INTERVAL)
+        else:
+            ew.log("WARN", f"Unknown profile_mode={profile_mode}, the run will not be profiled.")
+            return self.stream_input_events(ew)
+
+        profiler.enable()
+        try:
+            self.stream_input_events(ew)
+        finally:
+            profiler.disable()
+            self.report_profile(ew, profiler, profile_mode)
+
+    def report_profile(self, ew, _profiler, _profile_mode):
+
+        top_n = max(1, self.get_int_input_item("profile_top_n", 20))
+        checkpoint_dir = self._input_definition.metadata.get("checkpoint_dir")
+
+        if _profile_mode == "cprofile":
+            extension = ".profile.pstats"
+            stats = pstats.Stats(_profiler).stats
+            # (file, line, function) -> (primitive calls, calls, own time, cumulative time, callers)
+            ranked = sorted(stats.items(), key=lambda _item: _item[1][3], reverse=True)[:top_n]
+            for rank, ((fileName, line, function), (primitiveCalls, calls, ownTime, cumulativeTime, callers)) in enumerate(ranked, 1):
+                ew.log("INFO", f"Profile top {str(rank)}: cumtime_s={str(round(cumulativeTime, 3))} tottime_s={str(round(ownTime, 3))} calls={str(calls)} function={os.path.basename(fileName)}:{str(line)}({function})")
+        else:
+            extension = ".profile.folded"
+            samples = max(1, _profiler.samples)
+            for rank, (function, cumulativeSamples, ownSamples) in enumerate(_profiler.top(top_n), 1):
+                ew.log("INFO", f"Profile top {str(rank)}: cumulative_pct={str(round(100.0 * cumulativeSamples / samples, 1))} self_pct={str(round(100.0 * ownSamples / samples, 1))} samples={str(cumulativeSamples)} function={function}")
+
+        if not checkpoint_dir:
+            return
+        path = checkpoint_file_path(checkpoint_dir, self.input_name, extension)
+        try:
+            tmp_path = path + ".tmp"
+            _profiler.dump_stats(tmp_path)
+            os.replace(tmp_path, path)
+            ew.log("INFO", f"Profile of profile_mode={_profile_mode} written to file={path}")
+        except OSError as e:
+            ew.log("ERROR", f"Unable to write profile file={path}. err_msg=\"{str(e)}\"")
+
+    def stream_input_events(self, ew):
+        
+        start = time.time()
 
         base_url = str(self.input_items["base_url"]).strip()
         api_token = str(self.input_items["api_token"]).strip()
         archival_state = str(self.input_items["assessment_archival_state"]).strip()
         test_mode = 0
         test_mode = self.input_items["test_mode"]
+        max_workers = max(1, self.get_int_input_item("max_workers", 1))
+        http_pool_connections = max(1, self.get_int_input_item("http_pool_connections", 10))
+        page_workers = max(1, self.get_int_input_item("page_workers", 1))
+        # In pipeline mode the page workers share the session with the export workers
+        http_pool_maxsize = max(1, self.get_int_input_item("http_pool_maxsize", max(10, max_workers + page_workers)))
+        http_connect_timeout = max(0.0, self.get_float_input_item("http_connect_timeout", 10.0))
+        http_read_timeout = max(0.0, self.get_float_input_item("http_read_timeout", 120.0))
+        max_calls_per_sec = self.get_float_input_item("max_calls_per_sec", None)
+        if max_calls_per_sec is None or not 0 <= max_calls_per_sec < float("inf"):
+            if str(self.input_items.get("max_calls_per_sec") or "").strip() != "":
+                ew.log("WARN", f"Invalid max_calls_per_sec={str(self.input_items.get('max_calls_per_sec')).strip()}, no ceiling is configured.")
+            max_calls_per_sec = 0.0
+        list_retry_attempts = self.get_int_input_item("list_retry_attempts", 3)
+        export_retry_attempts = self.get_int_input_item("export_retry_attempts", 3)
+        retry_base_delay = self.get_float_input_item("retry_base_delay", 1.0)
+        retry_max_delay = self.get_float_input_item("retry_max_delay", 30.0)
+        retry_jitter = self.get_float_input_item("retry_jitter", 0.5)
+        incremental_mode = self.get_bool_input_item("incremental_mode", True)
+        export_cache_max_bytes = max(0, self.get_int_input_item("export_cache_max_bytes", 0))
+        pipeline_mode = self.get_bool_input_item("pipeline_mode", False) and int(test_mode) == 0
+        pipeline_queue_size = max(1, self.get_int_input_item("pipeline_queue_size", 1000))
+        stream_summary_pages = self.get_bool_input_item("stream_summary_pages", False)
+        checkpoint_dir = self._input_definition.metadata.get("checkpoint_dir")
+        details_field_spec = str(self.input_items.get("details_field_spec") or "").strip()
+        field_projection = str(self.input_items.get("field_projection") or "").strip()
+        qna_event_mode = str(self.input_items.get("qna_event_mode") or "array").strip().lower()
+        output_buffer_bytes = max(0, self.get_int_input_item("output_buffer_bytes", 0))
+        output_flush_interval = max(0.0, self.get_float_input_item("output_flush_interval", 5.0))
+        resume_interrupted_runs = self.get_bool_input_item("resume_interrupted_runs", True)
+        max_run_seconds = max(0, self.get_int_input_item("max_run_seconds", 0))
+        collect_run_metrics = self.get_bool_input_item("collect_run_metrics", True)
+        test_sample_size = max(0, self.get_int_input_item("test_sample_size", 0))
+        test_sample_strategy = str(self.input_items.get("test_sample_strategy") or "random").strip().lower()
+        hec_url = str(self.input_items.get("hec_url") or "").strip()
+        hec_token = str(self.input_items.get("hec_token") or "").strip()
+        hec_batch_size = max(1, self.get_int_input_item("hec_batch_size", 500))
+        hec_use_ack = self.get_bool_input_item("hec_use_ack", False)
+        hec_ack_timeout = max(0.0, self.get_float_input_item("hec_ack_timeout", 60.0))
+        hec_verify_ssl = self.get_bool_input_item("hec_verify_ssl", True)
+        export_order = str(self.input_items.get("export_order") or "api").strip().lower()
+        export_boosts = str(self.input_items.get("export_boosts") or "").strip()
+
+        if details_field_spec:
+            self.compile_details_field_spec(ew, details_field_spec)
+        if field_projection:
+            self.configure_field_projection(ew, field_projection, collect_run_metrics)
+        if qna_event_mode in self.QNA_EVENT_MODES:
+            self.qna_event_mode = qna_event_mode
+        else:
+            ew.log("WARN", f"Unknown qna_event_mode={qna_event_mode}, Questions and Responses are written as one onetrust:assessment:qna event per assessment.")
+        if output_buffer_bytes > 0:
+            ew.set_buffering(output_buffer_bytes, output_flush_interval or None)
 
         if base_url[-1] == '/':
             base_url = base_url.rstrip(base_url[-1])
         
-        ew.log("INFO", f"Streaming OneTrust Assessment Summary, Details, and Questions and Responses from base_url={base_url}. test_mode={str(test_mode)}")
+        ew.log("INFO", f"Streaming OneTrust Assessment Summary, Details, and Questions and Responses from base_url={base_url}. test_mode={str(test_mode)} max_workers={str(max_workers)} incremental_mode={str(incremental_mode)} pipeline_mode={str(pipeline_mode)} page_workers={str(page_workers)} stream_summary_pages={str(stream_summary_pages)} max_calls_per_sec={str(max_calls_per_sec)}")
+
+        session = None
+        checkpoint = None
+        runCursor = None
+        runCompleted = False
+        backlog = None
+        deferred = []
+        runStats = collections.Counter()
+        self.throttler = RequestThrottler(max_calls_per_sec)
+        # A stalled connection or read is retried like a connection error instead of hanging a worker
+        self.request_timeout = (http_connect_timeout or None, http_read_timeout or None)
+        self.metrics = RunMetrics()
+        runFailed = True
+        self.export_cache = None
+        self.list_retry_policy = RetryPolicy(list_retry_attempts, retry_base_delay, retry_max_delay, retry_jitter)
+        self.export_retry_policy = RetryPolicy(export_retry_attempts, retry_base_delay, retry_max_delay, retry_jitter)
 
         try:
             if api_token != self.MASK:
-                self.encrypt_keys(base_url, api_token, session_key)
-                self.mask_credentials(base_url, api_token, self.input_name, session_key)
+                self.encrypt_keys(base_url, api_token)
+                self.mask_credentials(base_url, api_token, self.input_name)
 
-            decrypted = self.decrypt_keys(base_url, session_key)
+            decrypted = self.decrypt_keys(base_url)
             self.CREDENTIALS = json.loads(decrypted)
             api_token = str(self.CREDENTIALS["apiToken"]).strip()
+            session = self.build_http_session(api_token, http_pool_connections, http_pool_maxsize)
+
+            if hec_url:
+                hec_retry_policy = RetryPolicy(export_retry_attempts, retry_base_delay, retry_max_delay, retry_jitter)
+                self.open_hec_sink(ew, hec_url, hec_token, hec_batch_size, hec_use_ack, hec_ack_timeout, hec_verify_ssl, hec_retry_policy)
 
-            # Assumes there at least 1 page
-            assessment_ids_pages = 1
-            page_flipper = 0
             apiScriptHost = socket.gethostname()
 
             ew.log("INFO", f"API credentials and other parameters retrieved. archival_state={archival_state}")
-            
-            all_assessments = {}
-            all_assessments['content'] = []
 
-            while page_flipper < assessment_ids_pages:
+            if int(test_mode) == 0 and incremental_mode and checkpoint_dir:
+                checkpoint = AssessmentCheckpoint(checkpoint_dir, self.input_name, base_url, self.output_fingerprint())
+                try:
+                    checkpoint.load()
+                except Exception as e:
+                    ew.log("WARN", f"Unable to read checkpoint file={checkpoint.path}, all Assessment Details will be collected. err_msg=\"{str(e)}\"")
+                if checkpoint.output_changed:
+                    ew.log("WARN", "qna_event_mode, details_field_spec or field_projection changed since the previous run, all Assessment Details will be collected again.")
 
-                assessment_ids_curpage = self.get_assessment_list(ew, base_url, api_token, archival_state, page_flipper)
+            if int(test_mode) == 0 and export_cache_max_bytes > 0 and checkpoint_dir:
+                export_cache = ExportCache(os.path.join(checkpoint_dir, "export_cache"), export_cache_max_bytes)
+                try:
+                    export_cache.load()
+                    self.export_cache = export_cache
+                except OSError as e:
+                    ew.log("WARN", f"Unable to open export cache directory={export_cache.cache_dir}, Assessment Details will not be cached. err_msg=\"{str(e)}\"")
 
-                # At first iteration, get the total number of pages
-                if page_flipper == 0:
-                    if "page" in assessment_ids_curpage:
-                        if "totalPages" in assessment_ids_curpage["page"]:
-                            assessment_ids_pages = assessment_ids_curpage["page"]["totalPages"]
-                            
-                if int(test_mode) == 1:
-                    ew.log("INFO", f"Test mode is enabled, so the collector will only perform GET call for page {page_flipper} and will not consume all {assessment_ids_pages} pages for Assessment Summary. Collection of Assessment Details and Questions/Answers will also be skipped.")
-                    assessment_ids_pages = 1
-                
-                if "content" not in assessment_ids_curpage:
-                    continue
-                
+            skipPages = set()
+            if int(test_mode) == 0 and resume_interrupted_runs and checkpoint_dir:
+                runCursor = RunCursor(checkpoint_dir, self.input_name, base_url, archival_state, self.output_fingerprint())
+                try:
+                    runCursor.load()
+                except Exception as e:
+                    ew.log("WARN", f"Unable to read run cursor file={runCursor.path}, the run will start from page 0. err_msg=\"{str(e)}\"")
+                if runCursor.resumed:
+                    skipPages = set(runCursor.completed_pages)
+                    # The interrupted run may not have saved its checkpoint
+                    if checkpoint is not None:
+                        for assessmentId, lastUpdated in runCursor.exported.items():
+                            checkpoint.update(assessmentId, lastUpdated)
+                    ew.log("INFO", f"Resuming interrupted run run_id={runCursor.run_id}. completed_pages={str(len(runCursor.completed_pages))} exported_assessments={str(len(runCursor.exported))}")
+                else:
+                    ew.log("INFO", f"Starting run run_id={runCursor.run_id}")
+
+            backlogged = {}
+            if int(test_mode) == 0 and max_run_seconds > 0 and checkpoint_dir:
+                backlog = ExportBacklog(checkpoint_dir, self.input_name, base_url, archival_state)
+                try:
+                    backlog.load()
+                except Exception as e:
+                    ew.log("WARN", f"Unable to read backlog file={backlog.path}, the previous backlog will be picked up from the Assessment Summary. err_msg=\"{str(e)}\"")
+                backlogged = {assessment.assessmentId: assessment.lastUpdated for assessment in backlog.assessments}
+                ew.log("INFO", f"Run budget is enabled. max_run_seconds={str(max_run_seconds)} backlog_assessments={str(len(backlog.assessments))}")
+
+            firstPageInfo = {}
+            pages = self.iter_assessment_pages(ew, base_url, session, archival_state, test_mode, page_workers, stream_summary_pages, skipPages, firstPageInfo)
+            if pipeline_mode:
+                summaryItems = self.iter_queued_summary_items(ew, pages, pipeline_queue_size)
+            else:
+                summaryItems = ((page_number, assessmentItem) for page_number, content in pages for assessmentItem in content)
+
+            seenAssessmentIds = set()
+            detailWorkList = self.write_assessment_summaries(ew, base_url, apiScriptHost, summaryItems, checkpoint, seenAssessmentIds, runStats, runCursor, backlogged)
+
+            if pipeline_mode:
+                ew.log("INFO", f"Pipeline mode is enabled, so Assessment Details are collected while Assessment Summary pages are still being retrieved. pipeline_queue_size={str(pipeline_queue_size)}")
+            else:
                 # Streaming all Assessment Summaries first
-                for assessmentItem in assessment_ids_curpage["content"]:
-                    assessmentItem["tenantHostname"] = base_url
-                    assessmentItem["apiPage"] = page_flipper
-                    assessmentItem["apiScriptHost"] = apiScriptHost
-                    assessmentSummary = Event()
-                    assessmentSummary.stanza = self.input_name
-                    assessmentSummary.sourceType  = "onetrust:assessment:summary"
-                    assessmentSummary.data = json.dumps(assessmentItem)
-                    ew.write_event(assessmentSummary)
-                    all_assessments["content"].append(assessmentItem)
-                
-                page_flipper += 1
+                detailWorkList = list(detailWorkList)
             
             if int(test_mode) == 0:
                 
-                totalAssessments = len(all_assessments["content"]) if "content" in all_assessments and all_assessments is not None else 0
-                
-                ew.log("INFO", f"Test mode is disabled, so the collector will loop through all Assessment IDs to collect Assessment Details. Total API call expected: {str(totalAssessments)}")
+                if not pipeline_mode:
+                    ew.log("INFO", f"Test mode is disabled, so the collector will loop through all Assessment IDs to collect Assessment Details. Total API call expected: {str(len(detailWorkList))}")
+                    if checkpoint is not None:
+                        ew.log("INFO", f"Incremental mode is enabled. {str(len(detailWorkList))} Assessment(s) are new or changed since the previous run, {str(runStats['skipped_exports'])} export call(s) will be skipped.")
                 
+                # The backlog left by the previous run is exported first
+                if backlog is not None and backlog.assessments:
+                    backlogItems = self.iter_backlog_items(ew, backlog, runCursor, runStats)
+                    if pipeline_mode:
+                        detailWorkList = itertools.chain(backlogItems, detailWorkList)
+                    else:
+                        detailWorkList = list(backlogItems) + detailWorkList
+                if export_order == "recent":
+                    if pipeline_mode:
+                        ew.log("WARN", "export_order=recent is ignored in pipeline mode, Assessment Details are collected in Assessment Summary page order.")
+                    else:
+                        # Freshly changed assessments are exported first, ties keep the page order
+                        detailWorkList.sort(key=self.compile_export_priority(ew, export_boosts), reverse=True)
+                elif export_order != "api":
+                    ew.log("WARN", f"Unknown export_order={export_order}, Assessment Details are collected in Assessment Summary page order.")
+
+                if backlog is not None:
+                    deadline = start + max_run_seconds * (1 - self.RUN_BUDGET_MARGIN)
+                    detailWorkList = self.iter_within_budget(ew, detailWorkList, deadline, deferred)
+
                 # Another round of looping the assessment_ids for Assessment Details
-                for assessment in all_assessments["content"]:
-                    if "assessmentId" not in assessment:
-                        continue
-                    assessmentId = assessment["assessmentId"]
-                    fullAssDetail = self.get_assessment_details(ew, base_url, api_token, assessmentId)
-                    if fullAssDetail is None: 
-                        continue
-                    trimmedAssDetail = self.assessment_json_bldr(ew, fullAssDetail)
-                    trimmedAssDetail["tenantHostname"] = base_url
-                    trimmedAssDetail["apiScriptHost"] = apiScriptHost
-                    assessmentDetails = Event()
-                    assessmentDetails.stanza = self.input_name
-                    assessmentDetails.sourceType  = "onetrust:assessment:details"
-                    assessmentDetails.data = json.dumps(trimmedAssDetail)
-                    ew.write_event(assessmentDetails)
-                    
-                    # Streaming Question and Responses
-                    assLastUpdated = "n/a"
-                    if "lastUpdated" in assessment:
-                        assLastUpdated = assessment["lastUpdated"]
-                    assTemplate = "n/a"
-                    if "templateName" in assessment:
-                        assTemplate = assessment["templateName"]
-                    trimmedAssQnA = self.assessment_questions_json_bldr(ew, fullAssDetail)
-                    trimmedAssQnA["lastUpdated"] = assLastUpdated
-                    trimmedAssQnA["templateName"] = assTemplate
-                    assessmentQnA = Event()
-                    assessmentQnA.stanza = self.input_name
-                    assessmentQnA.sourceType  = "onetrust:assessment:qna"
-                    assessmentQnA.data = json.dumps(trimmedAssQnA)
-                    ew.write_event(assessmentQnA)
+                exportCalls = 0
+                detailStart = time.time()
+                
+                for assessment, fullAssDetail in self.fetch_assessment_details(ew, base_url, session, detailWorkList, max_workers):
+                    exportCalls += 1
+                    if fullAssDetail is not None:
+                        self.write_assessment_detail_events(ew, base_url, apiScriptHost, assessment, fullAssDetail)
+                        if checkpoint is not None:
+                            checkpoint.update(assessment.assessmentId, assessment.lastUpdated)
+                    if runCursor is not None:
+                        runCursor.item_done(assessment.assessmentId, assessment.lastUpdated, fullAssDetail is not None)
+                        if runCursor.is_due(self.RUN_CURSOR_SAVE_INTERVAL):
+                            self.save_run_cursor(ew, runCursor)
+
+                # Every summary page has been consumed, so assessments no longer listed can be forgotten.
+                # The assessments of the pages skipped by a resumed run were not listed again
+                if checkpoint is not None and not skipPages:
+                    checkpoint.retain(seenAssessmentIds)
+
+                if backlog is not None:
+                    if deferred:
+                        ew.log("WARN", f"Run budget of max_run_seconds={str(max_run_seconds)} reached, {str(len(deferred))} Assessment export(s) are deferred to the next run.")
+                    try:
+                        if deferred:
+                            backlog.save(deferred)
+                        else:
+                            backlog.remove()
+                    except OSError as e:
+                        ew.log("ERROR", f"Unable to write backlog file={backlog.path}. err_msg=\"{str(e)}\"")
+
+                if runCursor is not None and runCursor.resumed:
+                    ew.log("INFO", f"Resumed run skipped {str(runStats['resumed_exports'])} export call(s) completed by the interrupted run and {str(len(skipPages))} completed page(s).")
+
+                if self.export_cache is not None:
+                    # Payloads served from the cache are not API calls
+                    exportCalls -= self.export_cache.hits
+                    ew.log("INFO", f"Export cache usage: cache_hits={str(self.export_cache.hits)} cache_misses={str(self.export_cache.misses)} cache_evictions={str(self.export_cache.evictions)} cache_bytes={str(self.export_cache.total_bytes)}")
+
+                detailElapsed = time.time() - detailStart
+                callsPerSec = round(exportCalls / detailElapsed, 2) if detailElapsed > 0 else 0
+                runCompleted = True
+                ew.log("INFO", f"Assessment Details collection completed. export_calls={str(exportCalls)} elapsed_s={str(round(detailElapsed, 2))} calls_per_sec={str(callsPerSec)} max_workers={str(max_workers)} skipped_exports={str(runStats['skipped_exports'])} rate_limited_responses={str(self.throttler.rate_limited)} calls_per_sec_ceiling={str(round(self.throttler.rate, 2))}")
+
+            elif test_sample_size > 0:
+                if test_sample_strategy not in ("random", "stratified"):
+                    ew.log("WARN", f"Unknown test_sample_strategy={test_sample_strategy}, a random sample will be exported.")
+                    test_sample_strategy = "random"
+                self.export_test_sample(ew, base_url, session, apiScriptHost, detailWorkList, firstPageInfo, test_sample_size, test_sample_strategy, max_workers, page_workers, max_calls_per_sec)
+
+            runFailed = False
 
         except Exception as e:
             ew.log("ERROR", f"Error streaming events: err_msg=\"{str(e)}\"")
+        finally:
+            if session is not None:
+                session.close()
+            # Events that did not reach HEC are exported again by the next run, from the previous checkpoint
+            deliveryFailed = False
+            if self.event_sink is not None:
+                try:
+                    self.event_sink.drain()
+                except Exception as e:
+                    ew.log("ERROR", f"HEC delivery failed, the checkpoint and run cursor of this run are not saved. err_msg=\"{str(e)}\"")
+                    deliveryFailed = True
+                    runFailed = True
+            if runCursor is not None:
+                if deliveryFailed:
+                    try:
+                        runCursor.remove()
+                    except OSError as e:
+                        ew.log("ERROR", f"Unable to remove run cursor file={runCursor.path}. err_msg=\"{str(e)}\"")
+                elif runCompleted:
+                    try:
+                        runCursor.remove()
+                    except OSError as e:
+                        ew.log("ERROR", f"Unable to remove run cursor file={runCursor.path}. err_msg=\"{str(e)}\"")
+                else:
+                    self.save_run_cursor(ew, runCursor)
+            if checkpoint is not None and not deliveryFailed:
+                try:
+                    checkpoint.save()
+                except Exception as e:
+                    ew.log("ERROR", f"Unable to write checkpoint file={checkpoint.path}. err_msg=\"{str(e)}\"")
+            # Also written when the run is aborted by sys.exit
+            if collect_run_metrics:
+                try:
+                    self.write_run_metrics(ew, base_url, time.time() - start, runFailed, runCursor, runStats)
+                except Exception as e:
+                    ew.log("ERROR", f"Unable to write run metrics. err_msg=\"{str(e)}\"")
+            if self.event_sink is not None:
+                try:
+                    self.event_sink.close()
+                except Exception as e:
+                    ew.log("ERROR", f"Unable to close the HEC sink. err_msg=\"{str(e)}\"")
             
+        if self.field_projections:
+            droppedFields = " ".join(f"{sourcetype}={str(projection.dropped_fields)}" for sourcetype, projection in self.field_projections.items())
+            ew.log("INFO", f"Field projection dropped fields before serialization: {droppedFields}")
+            if collect_run_metrics:
+                savedBytes = " ".join(f"{sourcetype}={str(projection.saved_bytes)}" for sourcetype, projection in self.field_projections.items())
+                ew.log("INFO", f"Field projection dropped bytes before serialization: {savedBytes}")
+
         end = time.time()
         elapsed = round((end - start) * 1000, 2)
-        ew.log("INFO", f"Streaming OneTrust Assessment Summary and Details has been successful / completed in {str(elapsed)} ms.")
+        ew.log("INFO", f"Streaming OneTrust Assessment Summary and Details has been successful / completed in {str(elapsed)} ms. list_retries={str(self.list_retry_policy.retries)} list_failures={str(self.list_retry_policy.failures)} export_retries={str(self.export_retry_policy.retries)} export_failures={str(self.export_retry_policy.failures)}")
 
 if __name__ == "__main__":
-    sys.exit(OneTrustAssessments().run(sys.argv))
\ No newline at end of file
+    sys.exit(OneTrustAssessments().run(sys.argv))
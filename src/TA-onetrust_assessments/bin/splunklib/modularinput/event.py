@@ -21,6 +21,24 @@ try:
 except ImportError as ie:
     import xml.etree.ElementTree as ET
 
+def _escape_text(text):
+    # Same escaping as ElementTree applies to element text
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+    return text
+
+
+def _element(tag, text):
+    # Empty text is serialized as a self-closing element, as ElementTree does
+    if not text:
+        return "<%s />" % tag
+    return "<%s>%s</%s>" % (tag, _escape_text(text), tag)
+
+
 class Event(object):
     """Represents an event or fragment of an event to be written by this modular input to Splunk.
 
@@ -72,13 +90,50 @@ class Event(object):
         self.time = time
         self.unbroken = unbroken
 
-    def write_to(self, stream):
-        """Write an XML representation of self, an ``Event`` object, to the given stream.
+    def to_xml(self):
+        """Returns the XML representation of self, an ``Event`` object, as bytes.
 
-        The ``Event`` object will only be written if its data field is defined,
+        The ``Event`` object will only be serialized if its data field is defined,
         otherwise a ``ValueError`` is raised.
 
-        :param stream: stream to write XML to.
+        The XML is produced by string formatting and is byte-for-byte identical to
+        the ``ElementTree`` serialization of ``to_xml_etree``, which is still used for
+        values the fast path does not handle.
+        """
+        if self.data is None:
+            raise ValueError("Events must have at least the data field set to be written to XML.")
+
+        stanza = self.stanza
+        values = (self.time, self.source, self.sourceType, self.index, self.host, self.data)
+        # Attribute escaping of CR, LF and TAB differs between Python versions
+        if (stanza is not None and (not isinstance(stanza, str) or "\r" in stanza or "\n" in stanza or "\t" in stanza)) or \
+                not all(value is None or isinstance(value, str) for value in values[1:]):
+            return self.to_xml_etree()
+
+        if stanza is None:
+            parts = ['<event unbroken="%d">' % int(self.unbroken)]
+        else:
+            parts = ['<event stanza="%s" unbroken="%d">' % (_escape_text(stanza).replace('"', "&quot;"), int(self.unbroken))]
+
+        # if a time isn't set, let Splunk guess by not creating a <time> element
+        if self.time is not None:
+            parts.append(_element("time", str(self.time)))
+
+        for node, value in zip(("source", "sourcetype", "index", "host", "data"), values[1:]):
+            if value is not None:
+                parts.append(_element(node, value))
+
+        if self.done:
+            parts.append("<done />")
+
+        parts.append("</event>")
+
+        # ElementTree serializes to US-ASCII with character references
+        return "".join(parts).encode("ascii", "xmlcharrefreplace")
+
+    def to_xml_etree(self):
+        """Returns the XML representation of self, an ``Event`` object, as bytes,
+        serialized by ``ElementTree``.
         """
         if self.data is None:
             raise ValueError("Events must have at least the data field set to be written to XML.")
@@ -107,8 +162,20 @@ class Event(object):
         if self.done:
             ET.SubElement(event, "done")
 
+        return ET.tostring(event)
+
+    def write_to(self, stream):
+        """Write an XML representation of self, an ``Event`` object, to the given stream.
+
+        The ``Event`` object will only be written if its data field is defined,
+        otherwise a ``ValueError`` is raised.
+
+        :param stream: stream to write XML to.
+        """
+        xml = self.to_xml()
+
         if isinstance(stream, TextIOBase):
-            stream.write(ensure_text(ET.tostring(event)))
+            stream.write(ensure_text(xml))
         else:
-            stream.write(ET.tostring(event))
-        stream.flush()
\ No newline at end of file
+            stream.write(xml)
+        stream.flush()
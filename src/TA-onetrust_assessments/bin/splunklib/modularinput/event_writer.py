@@ -14,6 +14,9 @@
 
 from __future__ import absolute_import
 import sys
+import threading
+import time
+from io import TextIOBase
 
 from splunklib.six import ensure_str
 from .event import ET
@@ -45,20 +48,102 @@ class EventWriter(object):
         self._out = output
         self._err = error
 
+        # Events are serialized to bytes, so they are written to the binary buffer of a
+        # text stream such as sys.stdout, when it has one, instead of being decoded first
+        self._binary_out = getattr(output, "buffer", None) if isinstance(output, TextIOBase) else None
+
         # has the opening <stream> tag been written yet?
         self.header_written = False
 
+        # buffered mode, see set_buffering
+        self._buffer_size = 0
+        self._flush_interval = None
+        self._buffer = []
+        self._buffered_bytes = 0
+        self._last_flush = time.time()
+        self._lock = threading.RLock()
+        self._flusher = None
+        self._closed = threading.Event()
+
+    def set_buffering(self, buffer_size, flush_interval=None):
+        """Switches this ``EventWriter`` to buffered mode, in which serialized events are
+        accumulated and written to the output stream in batches instead of being flushed
+        one by one.
+
+        The buffer is flushed once it holds ``buffer_size`` bytes or more, when
+        ``flush_interval`` seconds have passed since the last flush, and by ``flush``
+        and ``close``. A ``buffer_size`` of 0 switches back to writing and flushing
+        every event.
+
+        :param buffer_size: ``int``, number of bytes buffered before a flush.
+        :param flush_interval: ``float``, maximum number of seconds an event stays buffered, or None.
+        """
+        self.flush()
+        with self._lock:
+            self._buffer_size = buffer_size
+            self._flush_interval = flush_interval if buffer_size > 0 else None
+
+        if self._flush_interval and self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_periodically, name="eventwriter-flusher")
+            self._flusher.daemon = True
+            self._flusher.start()
+
+    def _flush_periodically(self):
+        while not self._closed.wait(min(self._flush_interval or 1.0, 1.0)):
+            with self._lock:
+                if self._buffer and self._flush_interval and time.time() - self._last_flush >= self._flush_interval:
+                    self.flush()
+
     def write_event(self, event):
         """Writes an ``Event`` object to Splunk.
 
         :param event: An ``Event`` object.
         """
 
-        if not self.header_written:
-            self._out.write("<stream>")
-            self.header_written = True
+        if self._buffer_size <= 0:
+            if not self.header_written:
+                self._write(b"<stream>")
+                self.header_written = True
+
+            self._write(event.to_xml())
+            self._out.flush()
+            return
+
+        xml = event.to_xml()
+
+        with self._lock:
+            if not self.header_written:
+                self._buffer.append(b"<stream>")
+                self.header_written = True
 
-        event.write_to(self._out)
+            self._buffer.append(xml)
+            self._buffered_bytes += len(xml)
+
+            if self._buffered_bytes >= self._buffer_size or \
+                    (self._flush_interval is not None and time.time() - self._last_flush >= self._flush_interval):
+                self.flush()
+
+    def flush(self):
+        """Writes the buffered events, if any, to the output stream and flushes it."""
+        with self._lock:
+            self._last_flush = time.time()
+            if not self._buffer:
+                return
+
+            data = b"".join(self._buffer)
+            self._buffer = []
+            self._buffered_bytes = 0
+
+            self._write(data)
+            self._out.flush()
+
+    def _write(self, data):
+        if self._binary_out is not None:
+            self._binary_out.write(data)
+        elif isinstance(self._out, TextIOBase):
+            self._out.write(ensure_str(data))
+        else:
+            self._out.write(data)
 
     def log(self, severity, message):
         """Logs messages about the state of this modular input to Splunk.
@@ -82,6 +167,9 @@ class EventWriter(object):
 
     def close(self):
         """Write the closing </stream> tag to make this XML well formed."""
-        if self.header_written:
-          self._out.write("</stream>")
-        self._out.flush()
+        self._closed.set()
+        with self._lock:
+            self.flush()
+            if self.header_written:
+              self._write(b"</stream>")
+            self._out.flush()
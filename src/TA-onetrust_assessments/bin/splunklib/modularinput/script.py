@@ -70,7 +70,11 @@ class Script(six.with_metaclass(ABCMeta, object)):
                 # passed on stdin as XML, and the script will write events on
                 # stdout and log entries on stderr.
                 self._input_definition = InputDefinition.parse(input_stream)
-                self.stream_events(self._input_definition, event_writer)
+                try:
+                    self.stream_events(self._input_definition, event_writer)
+                finally:
+                    # Events still buffered must not be lost, even when the script is exiting
+                    event_writer.flush()
                 event_writer.close()
                 return 0
 
@@ -0,0 +1,66 @@
+import itertools
+import json
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "src", "TA-onetrust_assessments", "bin"))
+
+from splunklib.modularinput import Event
+
+
+class EventToXmlTestCase(unittest.TestCase):
+    """Event.to_xml builds the XML by string formatting and must match the
+    ElementTree serialization of Event.to_xml_etree byte for byte."""
+
+    STANZAS = [None, "onetrust_assessments://prod", 'a "quoted" <stanza> & more', "café"]
+    TEXTS = [None, "", "plain", "<tag> & 'apos' \"quote\"", "café ☃ \U0001F600", "line\r\nbreak\ttab", "]]>"]
+
+    def assertSameXml(self, event):
+        self.assertEqual(event.to_xml(), event.to_xml_etree())
+
+    def test_escaping(self):
+        for stanza, text in itertools.product(self.STANZAS, self.TEXTS):
+            with self.subTest(stanza=stanza, text=text):
+                self.assertSameXml(Event(data=json.dumps({"name": text}), stanza=stanza, time=text and "1700000000.123",
+                                         host=text, index=text, source=text, sourcetype=text))
+                self.assertSameXml(Event(data=text if text is not None else "x", stanza=stanza))
+
+    def test_time(self):
+        for value in [None, "1700000000.123", 1700000000.5, 1700000000.0, 1700000000]:
+            with self.subTest(time=value):
+                event = Event(data="x", time=value)
+                self.assertSameXml(event)
+                self.assertEqual(b"<time>" in event.to_xml(), value is not None)
+
+    def test_done_and_unbroken(self):
+        for done, unbroken in itertools.product((False, True), (False, True)):
+            with self.subTest(done=done, unbroken=unbroken):
+                self.assertSameXml(Event(data="x", stanza="onetrust_assessments://prod", done=done, unbroken=unbroken))
+
+    def test_control_characters_in_stanza_fall_back_to_etree(self):
+        for stanza in ["tab\tstanza", "new\nline", "cr\rstanza"]:
+            with self.subTest(stanza=stanza):
+                event = Event(data="x", stanza=stanza)
+                with mock.patch.object(Event, "to_xml_etree", autospec=True, return_value=b"etree") as to_xml_etree:
+                    self.assertEqual(event.to_xml(), b"etree")
+                to_xml_etree.assert_called_once_with(event)
+                self.assertSameXml(event)
+
+    def test_non_string_fields_fall_back_to_etree(self):
+        for field in ["data", "host", "index", "source", "sourceType", "stanza"]:
+            with self.subTest(field=field):
+                event = Event(data="x")
+                setattr(event, field, b"bytes")
+                with mock.patch.object(Event, "to_xml_etree", autospec=True, return_value=b"etree") as to_xml_etree:
+                    self.assertEqual(event.to_xml(), b"etree")
+                to_xml_etree.assert_called_once_with(event)
+
+    def test_missing_data_raises(self):
+        with self.assertRaises(ValueError):
+            Event(stanza="onetrust_assessments://prod").to_xml()
+
+
+if __name__ == "__main__":
+    unittest.main()
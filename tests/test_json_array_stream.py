@@ -0,0 +1,59 @@
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "TA-onetrust_assessments", "bin"))
+
+from onetrust_assessments import JsonArrayStream
+
+
+def byte_chunks(_document):
+    data = _document.encode("utf-8")
+    return [data[i:i + 1] for i in range(len(data))]
+
+
+def stream_items(_chunks, _array_key="content"):
+    other_values = {}
+    items = list(JsonArrayStream(_chunks).iter_object_array(_array_key, other_values))
+    return items, other_values
+
+
+class JsonArrayStreamTestCase(unittest.TestCase):
+
+    DOCUMENTS = [
+        '{"a": 1e5, "content": [-0.5e-3]}',
+        '{"content": [1, 2.25, -3, 4E+2, 0, 10], "total": 12}',
+        '{"flag": true, "none": null, "content": [false, null, true], "off": false}',
+        '{ "content" : [ {"name": "café ✓", "score": 1.5e-7} , "x\\"y" ] , "page" : {"number": 0} }',
+        '{"content": [], "size": 20}',
+        '{}',
+    ]
+
+    def test_one_byte_at_a_time_matches_json_loads(self):
+        for document in self.DOCUMENTS:
+            expected = json.loads(document)
+            items, other_values = stream_items(byte_chunks(document))
+            self.assertEqual(items, expected.pop("content", []), document)
+            self.assertEqual(other_values, expected, document)
+
+    def test_every_split_point_matches_json_loads(self):
+        document = '{"a": 1e5, "b": 12.5, "content": [-0.5e-3, 100, true, null], "c": -7}'
+        expected = json.loads(document)
+        content = expected.pop("content")
+        data = document.encode("utf-8")
+        for split in range(1, len(data)):
+            items, other_values = stream_items([data[:split], data[split:]])
+            self.assertEqual(items, content, split)
+            self.assertEqual(other_values, expected, split)
+
+    def test_number_at_end_of_document(self):
+        self.assertEqual(JsonArrayStream(byte_chunks("12.5e1")).value(), 125.0)
+
+    def test_truncated_document_raises(self):
+        with self.assertRaises(ValueError):
+            stream_items(byte_chunks('{"content": [1, 2'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,189 @@
+"""End-to-end benchmark of the OneTrust Assessments collector against the local mock API.
+
+For every tenant size of --scales, starts tools/mock_onetrust_api.py in this process and runs
+OneTrustAssessments through Script.run_script in a child process, as splunkd would, with the
+input definition on stdin and events written to a pipe-like sink. Reports the wall time,
+events/sec, API calls/sec (from the mock's counters), injected 429/5xx responses and the peak
+RSS of the collector process.
+
+Input arguments of the collector are passed with --input, e.g.
+    python tools/bench_collector.py --scales 1000,10000 --export-latency-ms 20 \\
+        --input max_workers=8 --input pipeline_mode=1 --input output_buffer_bytes=1048576
+
+With --hec, events are sent to tools/mock_hec.py through the HEC sink instead of the pipe, and
+the events received by the mock are reported as well, e.g.
+    python tools/bench_collector.py --scales 10000 --hec --input hec_batch_size=1000 --input hec_use_ack=1
+
+Credentials are not stored in splunkd: the child overrides the storage/passwords calls.
+"""
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from xml.sax.saxutils import escape, quoteattr
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+BIN_DIR = os.path.join(TOOLS_DIR, "..", "src", "TA-onetrust_assessments", "bin")
+INPUT_NAME = "onetrust_assessments://bench"
+
+sys.path.insert(0, TOOLS_DIR)
+
+from mock_hec import MockHecConfig, start_mock_hec
+from mock_onetrust_api import add_mock_arguments, mock_config, start_mock_server
+
+
+class CountingRawIO(io.RawIOBase):
+
+    # Unbuffered sink standing in for the pipe to splunkd, counting the bytes written
+    def __init__(self):
+        self.fd = os.open(os.devnull, os.O_WRONLY)
+        self.bytes = 0
+
+    def writable(self):
+        return True
+
+    def write(self, _data):
+        self.bytes += len(_data)
+        return os.write(self.fd, _data)
+
+
+def input_definition_xml(_checkpoint_dir, _params):
+    params = "".join(f"<param name={quoteattr(name)}>{escape(str(value))}</param>" for name, value in _params.items())
+    return (f"<input><server_host>bench</server_host><server_uri>https://127.0.0.1:8089</server_uri>"
+            f"<session_key>bench</session_key><checkpoint_dir>{escape(_checkpoint_dir)}</checkpoint_dir>"
+            f"<configuration><stanza name={quoteattr(INPUT_NAME)}>{params}</stanza></configuration></input>")
+
+
+def run_child(_spec_path):
+    # Runs in the child process: one collector run, then writes its measurements next to the spec
+    sys.path.insert(0, BIN_DIR)
+    import resource
+    from onetrust_assessments import OneTrustAssessments
+    from splunklib.modularinput import EventWriter
+
+    with open(_spec_path) as f:
+        spec = json.load(f)
+
+    class BenchCollector(OneTrustAssessments):
+
+        def encrypt_keys(self, _base_url, _api_token):
+            pass
+
+        def mask_credentials(self, _base_url, _api_token, _input_name):
+            pass
+
+        def update_input(self, _input_name, _kwargs):
+            pass
+
+        def decrypt_keys(self, _base_url):
+            token = spec["hec_token"] if _base_url == spec["params"].get("hec_url") else "bench-token"
+            return json.dumps({"baseUrl": _base_url, "apiToken": token})
+
+    class CountingEventWriter(EventWriter):
+
+        events = 0
+
+        def write_event(self, event):
+            CountingEventWriter.events += 1
+            super(CountingEventWriter, self).write_event(event)
+
+    sink = CountingRawIO()
+    out = io.TextIOWrapper(io.BufferedWriter(sink, buffer_size=8192), encoding="utf-8")
+    with open(spec["log_path"], "w") as log:
+        ew = CountingEventWriter(out, log)
+        definition = io.BytesIO(input_definition_xml(spec["checkpoint_dir"], spec["params"]).encode("utf-8"))
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        exit_code = BenchCollector().run_script([INPUT_NAME], ew, definition)
+        out.flush()
+        wall = time.perf_counter() - wall
+        cpu = time.process_time() - cpu
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss_mb = peak_rss / (1024.0 * 1024.0) if sys.platform == "darwin" else peak_rss / 1024.0
+    with open(spec["result_path"], "w") as f:
+        json.dump({"exit_code": exit_code, "wall_s": wall, "cpu_s": cpu, "events": CountingEventWriter.events,
+                   "event_bytes": sink.bytes, "peak_rss_mb": peak_rss_mb}, f)
+
+
+def run_scale(_args, _assessments, _params):
+    config = mock_config(_args, _assessments)
+    server = start_mock_server(config)
+    hec_config = MockHecConfig()
+    hec_server = start_mock_hec(hec_config) if _args.hec else None
+    try:
+        with tempfile.TemporaryDirectory(prefix="bench_collector_") as work_dir:
+            checkpoint_dir = os.path.join(work_dir, "checkpoint")
+            os.makedirs(checkpoint_dir)
+            params = {"base_url": f"http://127.0.0.1:{server.server_port}", "api_token": "********",
+                      "assessment_archival_state": "ALL", "test_mode": "0", "incremental_mode": "0"}
+            if hec_server is not None:
+                params.update({"hec_url": f"http://127.0.0.1:{hec_server.server_port}", "hec_token": "********"})
+            params.update(_params)
+            spec = {"checkpoint_dir": checkpoint_dir, "params": params, "hec_token": hec_config.token,
+                    "log_path": os.path.join(work_dir, "collector.log"), "result_path": os.path.join(work_dir, "result.json")}
+            spec_path = os.path.join(work_dir, "spec.json")
+            with open(spec_path, "w") as f:
+                json.dump(spec, f)
+
+            subprocess.run([sys.executable, os.path.abspath(__file__), "--child", spec_path], check=True)
+
+            with open(spec["result_path"]) as f:
+                result = json.load(f)
+            with open(spec["log_path"]) as f:
+                errors = [line.strip() for line in f if line.startswith("ERROR")]
+
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_port}/__stats") as response:
+            result["mock"] = json.load(response)
+        result["errors"] = errors
+        result["hec"] = hec_config.snapshot() if hec_server is not None else None
+        return result
+    finally:
+        server.shutdown()
+        server.server_close()
+        if hec_server is not None:
+            hec_server.shutdown()
+            hec_server.server_close()
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == "--child":
+        run_child(sys.argv[2])
+        return
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", default="100,1000,10000", help="comma-separated tenant sizes")
+    parser.add_argument("--input", action="append", default=[], metavar="NAME=VALUE", help="collector input argument, repeatable")
+    parser.add_argument("--hec", action="store_true", help="send events to a local mock HEC instead of the pipe")
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    params = dict(item.split("=", 1) for item in args.input)
+    print(f"Collector inputs: {json.dumps(params)}")
+    print(f"{'assessments':>11} {'wall s':>8} {'cpu s':>7} {'events':>8} {'events/s':>9} {'api calls':>9} {'calls/s':>8} {'429':>5} {'5xx':>5} {'MB out':>7} {'peak RSS MB':>11}")
+    for assessments in [int(scale) for scale in args.scales.split(",")]:
+        result = run_scale(args, assessments, params)
+        mock = result["mock"]
+        calls = mock["list_calls"] + mock["export_calls"]
+        wall = result["wall_s"]
+        print(f"{assessments:>11} {wall:>8.2f} {result['cpu_s']:>7.2f} {result['events']:>8} {result['events'] / wall:>9.0f} "
+              f"{calls:>9} {calls / wall:>8.1f} {mock['status_429']:>5} {mock['status_5xx']:>5} "
+              f"{result['event_bytes'] / 1048576.0:>7.1f} {result['peak_rss_mb']:>11.1f}")
+        if result["hec"] is not None:
+            hec = result["hec"]
+            print(f"    HEC received {hec['events']} events in {hec['event_calls']} posts, "
+                  f"{hec['bytes_received'] / 1048576.0:.1f} MB uncompressed, {hec['ack_calls']} ack queries, {hec['status_503']} 503")
+        for error in result["errors"][:5]:
+            print(f"    {error}")
+        if result["exit_code"] != 0:
+            print(f"    collector exited with code {result['exit_code']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Benchmark of the modular input Event serializer, string template against ElementTree.
+
+Times Event.to_xml and the ElementTree serialization of Event.to_xml_etree on a typical onetrust
+event. tests/modularinput/test_event.py checks that both produce the same XML.
+
+Usage: python tools/bench_event_serializer.py [--events 100000]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "TA-onetrust_assessments", "bin"))
+
+from splunklib.modularinput import Event
+
+
+def timed(_fn, _event, _events):
+    start = time.perf_counter()
+    for index in range(_events):
+        _fn(_event)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=100000)
+    args = parser.parse_args()
+
+    event = Event()
+    event.stanza = "onetrust_assessments://bench"
+    event.sourceType = "onetrust:assessment:summary"
+    event.data = json.dumps({
+        "assessmentId": "7d4e5f60-1a2b-4c3d-9e8f-0123456789ab", "name": "Vendor onboarding <ACME & Co>", "number": 4242,
+        "lastUpdated": "2024-01-01T00:00:00.000", "templateName": "Vendor Risk Template", "status": "COMPLETED",
+        "orgGroup": {"id": "0f1e2d3c-4b5a-6978-8796-a5b4c3d2e1f0", "name": "Global"}, "residualRiskScore": 3,
+        "tenantHostname": "https://customer.my.onetrust.com", "apiPage": 0, "apiScriptHost": "hf01"
+    })
+
+    # Alternate the variants and keep the best round to reduce noise
+    best = {"etree": float("inf"), "template": float("inf")}
+    for round in range(5):
+        best["etree"] = min(best["etree"], timed(Event.to_xml_etree, event, args.events))
+        best["template"] = min(best["template"], timed(Event.to_xml, event, args.events))
+
+    print(f"{'serializer':>10} {'seconds':>8} {'events/s':>10}")
+    for name, seconds in best.items():
+        print(f"{name:>10} {seconds:>8.3f} {args.events / seconds:>10.0f}")
+    print(f"speedup {best['etree'] / best['template']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
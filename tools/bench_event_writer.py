@@ -0,0 +1,83 @@
+"""Benchmark of the modular input EventWriter, per-event flush against buffered mode.
+
+Writes N events of a typical onetrust:assessment:summary size through
+splunklib.modularinput.EventWriter into a pipe drained by a child process, as splunkd does with
+the stdout of a modular input, and reports the wall time, CPU time and write syscalls of each mode.
+
+Usage: python tools/bench_event_writer.py [--events 100000] [--buffer-sizes 0,65536,1048576]
+"""
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "TA-onetrust_assessments", "bin"))
+
+from splunklib.modularinput import Event, EventWriter
+
+
+class CountingRawIO(io.RawIOBase):
+
+    # Unbuffered file descriptor wrapper counting write syscalls
+    def __init__(self, _fd):
+        self.fd = _fd
+        self.writes = 0
+
+    def writable(self):
+        return True
+
+    def write(self, _data):
+        self.writes += 1
+        return os.write(self.fd, _data)
+
+
+def run(_events, _buffer_size, _body):
+    drain = subprocess.Popen([sys.executable, "-c", "import sys, shutil; shutil.copyfileobj(sys.stdin.buffer, open(__import__('os').devnull, 'wb'))"], stdin=subprocess.PIPE)
+    raw = CountingRawIO(drain.stdin.fileno())
+    # Same layering as sys.stdout: a text wrapper over a buffered binary stream
+    out = io.TextIOWrapper(io.BufferedWriter(raw, buffer_size=8192), encoding="utf-8")
+    ew = EventWriter(out, io.StringIO())
+    if _buffer_size > 0:
+        ew.set_buffering(_buffer_size, 5.0)
+
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    for index in range(_events):
+        event = Event()
+        event.stanza = "onetrust_assessments://bench"
+        event.sourceType = "onetrust:assessment:summary"
+        event.data = _body
+        ew.write_event(event)
+    ew.close()
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+
+    drain.stdin.close()
+    drain.wait()
+    return wall, cpu, raw.writes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=100000)
+    parser.add_argument("--buffer-sizes", default="0,65536,1048576")
+    args = parser.parse_args()
+
+    body = json.dumps({
+        "assessmentId": "7d4e5f60-1a2b-4c3d-9e8f-0123456789ab", "name": "Vendor onboarding <ACME & Co>", "number": 4242,
+        "lastUpdated": "2024-01-01T00:00:00.000", "templateName": "Vendor Risk Template", "status": "COMPLETED",
+        "orgGroup": {"id": "0f1e2d3c-4b5a-6978-8796-a5b4c3d2e1f0", "name": "Global"}, "residualRiskScore": 3,
+        "tenantHostname": "https://customer.my.onetrust.com", "apiPage": 0, "apiScriptHost": "hf01"
+    })
+
+    print(f"{'buffer bytes':>12} {'wall s':>8} {'cpu s':>8} {'events/s':>10} {'writes':>8}")
+    for buffer_size in [int(b) for b in args.buffer_sizes.split(",")]:
+        wall, cpu, writes = run(args.events, buffer_size, body)
+        print(f"{buffer_size:>12} {wall:>8.2f} {cpu:>8.2f} {args.events / wall:>10.0f} {writes:>8}")
+
+
+if __name__ == "__main__":
+    main()
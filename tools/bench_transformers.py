@@ -0,0 +1,246 @@
+"""Micro-benchmark of the export payload transformers.
+
+Compares the former two-pass builders (assessment_json_bldr walking the first section for the
+request title, then assessment_questions_json_bldr walking every section again) against the
+single-pass OneTrustAssessments.assessment_events_bldr, on synthetic exports of increasing size.
+Both must produce identical event bodies.
+
+Usage: python tools/bench_transformers.py [--questions 50,500,2000] [--repeat 200]
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "TA-onetrust_assessments", "bin"))
+
+from onetrust_assessments import OneTrustAssessments
+
+
+class TwoPassBuilders(object):
+
+    # Copy of the builders as they were before the single-pass transformer
+    NO_JSON_DATA = "n/a"
+
+    def assessment_json_bldr(self, ew, _data):
+        assessmentJsonRetVal = {}
+
+        assessmentJsonRetVal['assessmentId'] = self.NO_JSON_DATA
+        if 'assessmentId' in _data:
+            assessmentJsonRetVal['assessmentId'] = _data['assessmentId']
+
+        assessmentJsonRetVal['assessmentNumber'] = self.NO_JSON_DATA
+        if 'assessmentNumber' in _data:
+            assessmentJsonRetVal['assessmentNumber'] = _data['assessmentNumber']
+
+        assessmentJsonRetVal['lastUpdated'] = self.NO_JSON_DATA
+        if 'lastUpdated' in _data:
+            assessmentJsonRetVal['lastUpdated'] = _data['lastUpdated']
+
+        assessmentJsonRetVal['submittedOn'] = self.NO_JSON_DATA
+        if 'lastUpdated' in _data:
+            assessmentJsonRetVal['submittedOn'] = _data['submittedOn']
+
+        assessmentJsonRetVal['completedOn'] = self.NO_JSON_DATA
+        if 'completedOn' in _data:
+            assessmentJsonRetVal['completedOn'] = _data['completedOn']
+
+        assessmentJsonRetVal['createdDT'] = self.NO_JSON_DATA
+        if 'createdDT' in _data:
+            assessmentJsonRetVal['createdDT'] = _data['createdDT']
+
+        assessmentJsonRetVal['template'] = self.NO_JSON_DATA
+        if 'template' in _data:
+            if 'name' in _data['template']:
+                assessmentJsonRetVal['templateName'] = _data['template']['name']
+
+        assessmentJsonRetVal['title'] = self.NO_JSON_DATA
+        if 'name' in _data:
+            assessmentJsonRetVal['title'] = _data['name']
+
+        assessmentJsonRetVal['orgGroup'] = self.NO_JSON_DATA
+        if 'orgGroup' in _data:
+            if 'name' in _data['orgGroup']:
+                assessmentJsonRetVal['orgGroup'] = _data['orgGroup']['name']
+
+        assessmentJsonRetVal['createdBy'] = self.NO_JSON_DATA
+        if 'createdBy' in _data:
+            if 'name' in _data['createdBy']:
+                assessmentJsonRetVal['createdBy'] = _data['createdBy']['name']
+
+        assessmentJsonRetVal['responseTitle'] = self.NO_JSON_DATA
+        if 'sections' in _data:
+            if len(_data['sections']) > 0:
+                if 'questions' in _data['sections'][0]:
+                    for question in _data['sections'][0]['questions']:
+                        if 'content' in question['question']:
+                            if question['question']['content'] == 'Please provide a request title':
+                                if len(question['questionResponses']) > 0:
+                                    if len(question['questionResponses'][0]['responses']) > 0:
+                                        assessmentJsonRetVal['responseTitle'] = question['questionResponses'][0]['responses'][0]['response']
+                                        break
+
+        assessmentJsonRetVal['approvalInfo'] = []
+        if 'approvers' in _data:
+            for approvers in _data['approvers']:
+                assessmentJsonRetVal['approvalInfo'].append({
+                    "approvers": approvers['approver']['fullName'], 
+                    "approvedOn": approvers['approvedOn'], 
+                    "approverResult": approvers['resultName']
+                    })
+
+        assessmentJsonRetVal['respondent'] = self.NO_JSON_DATA
+        if 'respondent' in _data:
+            if 'name' in _data['respondent']:
+                assessmentJsonRetVal['respondent'] = _data['respondent']['name']
+        
+        assessmentJsonRetVal['respondents'] = self.NO_JSON_DATA
+        if 'respondents' in _data:
+            respondent_names = [r['name'] for r in _data['respondents']]
+            assessmentJsonRetVal['respondents'] = respondent_names
+
+        assessmentJsonRetVal['status'] = self.NO_JSON_DATA
+        if 'status' in _data:
+            assessmentJsonRetVal['status'] = _data['status']
+
+        assessmentJsonRetVal['result'] = self.NO_JSON_DATA
+        if 'result' in _data:
+            assessmentJsonRetVal['result'] = _data['result']
+
+        assessmentJsonRetVal['riskLevel'] = self.NO_JSON_DATA
+        if 'residualRiskScore' in _data:
+            assessmentJsonRetVal['riskLevel'] = _data['residualRiskScore']
+        
+        return assessmentJsonRetVal
+
+    def assessment_questions_json_bldr(self, ew, _data):
+        
+        questionsRetVal = {}
+        questionsRetVal['assessmentId'] = _data['assessmentId']
+        questionsRetVal['questionsAndAnswers'] = []
+
+        if "sections" in _data:
+            for section in _data['sections']:
+                if "header" in section:
+                    if "name" in section['header']:
+                        sectionNameContent = section['header']['name']
+                        if re.search(r"Frequently\sAsked\sQuestions?", sectionNameContent):
+                            continue
+                        questionsRetVal['sectionName'] = sectionNameContent
+                    if "description" in section['header']:
+                        questionsRetVal['description'] = section['header']['description']
+                    if "sequence" in section['header']:
+                        questionsRetVal['sequence'] = section['header']['sequence']
+                if "questions" in section:
+                    for question in section['questions']:
+                        qna = {}
+                        # Question key-val-pair
+                        if "question" in question:
+                            if "content" in question['question']:
+                                qna['question'] = question['question']['content']
+                            if "sequence" in question['question']:
+                                qna['questionSeq'] = question['question']['sequence']
+                                
+                        # Responses key-val-pair (array)
+                        allResponses = []
+                        defaultResponse = "n/a"
+                        if "questionResponses" in question:
+                            for questionResponse in question['questionResponses']:
+                                if "responses" in questionResponse:
+                                    for response in questionResponse['responses']:
+                                        if "response" in response:
+                                            defaultResponse = response['response']
+                                            allResponses.append(defaultResponse)
+                        qna['responses'] = allResponses
+                                    
+                        questionsRetVal['questionsAndAnswers'].append(qna)
+                                    
+        return questionsRetVal
+
+
+def synthetic_export(_questions, _title_first=True, _sections=10, _seed=0):
+    rnd = random.Random(_seed)
+    sections = []
+    per_section = max(1, _questions // _sections)
+    for s in range(_sections):
+        name = "Frequently Asked Questions" if s == _sections - 1 else f"Section {s}"
+        questions = []
+        for q in range(per_section):
+            content = "Please provide a request title" if _title_first and s == 0 and q == 0 else f"Question {s}.{q} " + "x" * rnd.randint(20, 120)
+            questions.append({
+                "question": {"content": content, "sequence": q + 1, "id": f"q-{s}-{q}"},
+                "questionResponses": [{"responses": [{"response": "r" * rnd.randint(1, 60), "responseId": f"r-{s}-{q}-{r}"} for r in range(rnd.randint(0, 3))]}]
+            })
+        sections.append({"header": {"name": name, "description": "d" * 80, "sequence": s + 1}, "questions": questions})
+    return {
+        "assessmentId": "7d4e5f60-1a2b-4c3d-9e8f-0123456789ab", "assessmentNumber": 42, "name": "Synthetic",
+        "lastUpdated": "2024-01-01T00:00:00.000", "submittedOn": "2024-01-01T00:00:00.000", "createdDT": "2024-01-01T00:00:00.000",
+        "template": {"name": "Template"}, "orgGroup": {"name": "Org"}, "createdBy": {"name": "Creator"},
+        "approvers": [{"approver": {"fullName": "Approver"}, "approvedOn": "2024-01-01", "resultName": "Approved"}],
+        "respondent": {"name": "Respondent"}, "respondents": [{"name": "Respondent"}],
+        "status": "COMPLETED", "result": "Approved", "residualRiskScore": 3, "sections": sections
+    }
+
+
+def sparse_exports():
+    # Exports with optional members missing, where a field may be left out of the event
+    for path in ("template", "template.name", "name", "orgGroup", "orgGroup.name", "createdBy", "respondent", "respondents",
+                 "approvers", "createdDT", "status", "result", "residualRiskScore", "sections"):
+        export = synthetic_export(20)
+        parent = export
+        keys = path.split(".")
+        for key in keys[:-1]:
+            parent = parent[key]
+        del parent[keys[-1]]
+        yield path, export
+
+
+def timed(_variants, _repeat, _rounds=15):
+    # Variants are run alternately and the best round is kept, to be robust to a noisy host
+    best = [None] * len(_variants)
+    for _ in range(_rounds):
+        for index, fn in enumerate(_variants):
+            start = time.process_time()
+            for _ in range(_repeat):
+                fn()
+            elapsed = (time.process_time() - start) / _repeat
+            best[index] = elapsed if best[index] is None else min(best[index], elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--questions", default="50,500,2000")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    legacy = TwoPassBuilders()
+    fused = OneTrustAssessments()
+
+    for path, export in sparse_exports():
+        expected = (legacy.assessment_json_bldr(None, export), legacy.assessment_questions_json_bldr(None, export))
+        actual = fused.assessment_events_bldr(None, export)[:2]
+        assert json.dumps(expected) == json.dumps(actual), f"single-pass output differs from the two-pass builders without {path}"
+
+    print(f"{'questions':>10} {'title':>8} {'two-pass us':>12} {'single-pass us':>15} {'saved':>7}")
+    for questions, title_first in [(int(q), t) for q in args.questions.split(",") for t in (True, False)]:
+        # Without a request title question, the two-pass builders walk the whole first section twice
+        export = synthetic_export(questions, title_first)
+        repeat = max(1, args.repeat * 50 // questions)
+
+        expected = (legacy.assessment_json_bldr(None, export), legacy.assessment_questions_json_bldr(None, export))
+        actual = fused.assessment_events_bldr(None, export)[:2]
+        assert json.dumps(expected) == json.dumps(actual), "single-pass output differs from the two-pass builders"
+
+        two_pass, single_pass = timed([
+            lambda: (legacy.assessment_json_bldr(None, export), legacy.assessment_questions_json_bldr(None, export)),
+            lambda: fused.assessment_events_bldr(None, export)
+        ], repeat)
+        print(f"{questions:>10} {'first' if title_first else 'absent':>8} {two_pass * 1e6:>12.1f} {single_pass * 1e6:>15.1f} {(1 - single_pass / two_pass) * 100:>6.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""Local stand-in for the Splunk HTTP Event Collector, for benchmarks and tests without an indexer.
+
+Serves POST /services/collector/raw (gzipped or plain, one JSON event per line, with sourcetype,
+source, host and index as query parameters), POST /services/collector/event (concatenated JSON
+events) and POST /services/collector/ack on the stdlib HTTP server. Checks the "Splunk <token>"
+authorization, and the request channel of the raw endpoint. Counts the events by sourcetype and
+optionally appends them as NDJSON to a file, in the /event format. Every batch gets
+an ackId, acknowledged --ack-delay-ms after it was received; --rate-503 injects server busy
+responses. GET /__stats returns the counters as JSON.
+
+Usage: python tools/mock_hec.py [--port 8088] [--token bench-hec-token] [--ack-delay-ms 0]
+           [--rate-503 0.0] [--output events.ndjson]
+
+Point hec_url of an input at http://127.0.0.1:<port>.
+"""
+import argparse
+import collections
+import gzip
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+EVENT_PATH = "/services/collector/event"
+RAW_PATH = "/services/collector/raw"
+ACK_PATH = "/services/collector/ack"
+
+
+class MockHecConfig(object):
+
+    def __init__(self, _token="bench-hec-token", _ack_delay_ms=0.0, _rate_503=0.0, _output=None, _seed=0):
+        self.token = _token
+        self.ack_delay = _ack_delay_ms / 1000.0
+        self.rate_503 = _rate_503
+        self.output = open(_output, "a", encoding="utf-8") if _output else None
+        self.rng = random.Random(_seed)
+        self.lock = threading.Lock()
+        self.next_ack_id = 0
+        # ackId -> time at which the batch counts as indexed
+        self.acks = {}
+        self.sourcetypes = collections.Counter()
+        self.stats = {"event_calls": 0, "ack_calls": 0, "events": 0, "bytes_received": 0, "status_503": 0, "status_4xx": 0}
+
+    def busy(self):
+        with self.lock:
+            return self.rng.random() < self.rate_503
+
+    def index(self, _events, _bytes):
+        with self.lock:
+            self.stats["events"] += len(_events)
+            self.stats["bytes_received"] += _bytes
+            for event in _events:
+                self.sourcetypes[event.get("sourcetype")] += 1
+            if self.output is not None:
+                self.output.write("".join(json.dumps(event) + "\n" for event in _events))
+                self.output.flush()
+            ack_id = self.next_ack_id
+            self.next_ack_id += 1
+            self.acks[ack_id] = time.monotonic() + self.ack_delay
+            return ack_id
+
+    def acknowledged(self, _ack_ids):
+        now = time.monotonic()
+        with self.lock:
+            return {str(ack_id): ack_id in self.acks and self.acks[ack_id] <= now for ack_id in _ack_ids}
+
+    def count(self, _key):
+        with self.lock:
+            self.stats[_key] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats, sourcetypes=dict(self.sourcetypes))
+
+
+def parse_events(_body):
+    # HEC accepts JSON objects one after another, with or without newlines in between
+    decoder = json.JSONDecoder()
+    text = _body.decode("utf-8")
+    events = []
+    position = 0
+    while True:
+        while position < len(text) and text[position].isspace():
+            position += 1
+        if position >= len(text):
+            return events
+        event, position = decoder.raw_decode(text, position)
+        if not isinstance(event, dict) or "event" not in event:
+            raise ValueError("Event field is required")
+        events.append(event)
+
+
+def parse_raw_events(_body, _query):
+    # Every line is broken into one event, as with LINE_BREAKER = ([\r\n]+). The collector writes
+    # JSON events, which are checked here so that a serialization error does not go unnoticed
+    metadata = {key: values[0] for key, values in parse_qs(_query).items() if key in ("sourcetype", "source", "host", "index")}
+    events = []
+    for line in _body.decode("utf-8").splitlines():
+        if line.strip():
+            json.loads(line)
+            events.append(dict(metadata, event=line))
+    return events
+
+
+class MockHecHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+    config = None
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, _status, _body):
+        body = json.dumps(_body).encode("utf-8")
+        self.send_response(_status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        if _status == 503:
+            self.config.count("status_503")
+        elif _status >= 400:
+            self.config.count("status_4xx")
+
+    def do_GET(self):
+        if urlsplit(self.path).path == "/__stats":
+            self.send(200, self.config.snapshot())
+        else:
+            self.send(404, {"text": "Not found", "code": 404})
+
+    def do_POST(self):
+        config = self.config
+        url = urlsplit(self.path)
+        path = url.path
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        if self.headers.get("Authorization") != f"Splunk {config.token}":
+            self.send(401, {"text": "Invalid token", "code": 4})
+            return
+
+        if path == ACK_PATH:
+            config.count("ack_calls")
+            try:
+                ack_ids = json.loads(body)["acks"]
+            except (ValueError, KeyError):
+                self.send(400, {"text": "Invalid data format", "code": 6})
+                return
+            self.send(200, {"acks": config.acknowledged(ack_ids)})
+            return
+
+        if path not in (EVENT_PATH, RAW_PATH):
+            self.send(404, {"text": "Not found", "code": 404})
+            return
+        if path == RAW_PATH and not self.headers.get("X-Splunk-Request-Channel"):
+            self.send(400, {"text": "Data channel is missing", "code": 10})
+            return
+
+        config.count("event_calls")
+        if config.busy():
+            self.send(503, {"text": "Server is busy", "code": 9})
+            return
+        try:
+            if self.headers.get("Content-Encoding") == "gzip":
+                body = gzip.decompress(body)
+            events = parse_raw_events(body, url.query) if path == RAW_PATH else parse_events(body)
+        except (OSError, ValueError) as e:
+            self.send(400, {"text": f"Invalid data format: {e}", "code": 6})
+            return
+        if not events:
+            self.send(400, {"text": "No data", "code": 5})
+            return
+        self.send(200, {"text": "Success", "code": 0, "ackId": config.index(events, len(body))})
+
+
+def start_mock_hec(_config, _port=0):
+    """Starts the mock HEC on a daemon thread and returns the server, whose server_port is bound."""
+    handler = type("BoundMockHecHandler", (MockHecHandler,), {"config": _config})
+    server = ThreadingHTTPServer(("127.0.0.1", _port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="mock-hec", daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8088)
+    parser.add_argument("--token", default="bench-hec-token")
+    parser.add_argument("--ack-delay-ms", type=float, default=0.0, help="time before a batch is acknowledged as indexed")
+    parser.add_argument("--rate-503", type=float, default=0.0, help="share of event posts answered 503")
+    parser.add_argument("--output", help="append the received events to this NDJSON file")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = start_mock_hec(MockHecConfig(args.token, args.ack_delay_ms, args.rate_503, args.output, args.seed), args.port)
+    print(f"Mock HEC listening on http://127.0.0.1:{server.server_port} with token {args.token}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""Local stand-in for the OneTrust Assessment API, for benchmarks and tests without a real tenant.
+
+Serves GET /api/assessment/v2/assessments (the paged Assessment Summary) and
+GET /api/assessment/v2/assessments/<assessmentId>/export from a synthetic tenant, on the stdlib
+HTTP server. The tenant size, page size, export payload size, response latency and injected
+429/5xx errors are configurable. GET /__stats returns the request counters as JSON.
+
+Usage: python tools/mock_onetrust_api.py [--port 8765] [--assessments 10000] [--page-size 2000]
+           [--questions 20] [--response-bytes 64] [--latency-ms 50] [--latency-dist exponential]
+           [--rate-429 0.01] [--rate-5xx 0.01] [--max-rps 0]
+
+Point base_url of an input at http://127.0.0.1:<port>.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+STATUSES = ("COMPLETED", "IN_PROGRESS", "UNDER_REVIEW", "NOT_STARTED")
+TEMPLATES = ("Vendor Risk Template", "Privacy Impact Assessment", "Data Protection Impact Assessment", "IT Security Questionnaire")
+EXPORT_PATH = re.compile(r"^/api/assessment/v2/assessments/([^/]+)/export$")
+LIST_PATH = "/api/assessment/v2/assessments"
+
+
+class MockTenant(object):
+
+    # Deterministic synthetic tenant: assessment i always has the same summary and export
+    def __init__(self, _assessments, _questions=20, _response_bytes=64, _seed=0):
+        self.assessments = _assessments
+        self.questions = _questions
+        self.response_bytes = _response_bytes
+        self.seed = _seed
+
+    def assessment_id(self, _index):
+        return "%08x-0000-4000-8000-%012x" % (self.seed, _index)
+
+    def index_of(self, _assessmentId):
+        try:
+            index = int(_assessmentId.rsplit("-", 1)[1], 16)
+        except (IndexError, ValueError):
+            return None
+        if _assessmentId != self.assessment_id(index) or index >= self.assessments:
+            return None
+        return index
+
+    def last_updated(self, _index):
+        return time.strftime("%Y-%m-%dT%H:%M:%S.000", time.gmtime(1700000000 + _index * 37))
+
+    def summary(self, _index):
+        return {
+            "assessmentId": self.assessment_id(_index), "name": f"Assessment {_index}", "number": _index,
+            "lastUpdated": self.last_updated(_index), "templateName": TEMPLATES[_index % len(TEMPLATES)],
+            "status": STATUSES[_index % len(STATUSES)], "residualRiskScore": _index % 5,
+            "orgGroup": {"id": "0f1e2d3c-4b5a-6978-8796-a5b4c3d2e1f0", "name": "Global"}
+        }
+
+    def page(self, _page, _size):
+        total_pages = max(1, (self.assessments + _size - 1) // _size)
+        first = _page * _size
+        content = [self.summary(index) for index in range(first, min(self.assessments, first + _size))]
+        return {"content": content, "page": {"number": _page, "size": _size, "totalElements": self.assessments, "totalPages": total_pages}}
+
+    def export(self, _index):
+        rng = random.Random(self.seed * 1000003 + _index)
+        response = lambda: "".join(rng.choice("abcdefghijklmnopqrstuvwxyz <>&\"") for _ in range(self.response_bytes))
+        questions = [{
+            "question": {"content": f"Question {q} <with markup & \"quotes\">", "sequence": q + 1},
+            "questionResponses": [{"responses": [{"response": response()} for _ in range(1 + q % 2)]}]
+        } for q in range(self.questions)]
+        title = {"question": {"content": "Please provide a request title", "sequence": 0},
+                 "questionResponses": [{"responses": [{"response": f"Request {_index}"}]}]}
+        half = len(questions) // 2
+        return {
+            "assessmentId": self.assessment_id(_index), "assessmentNumber": _index, "name": f"Assessment {_index}",
+            "lastUpdated": self.last_updated(_index), "submittedOn": self.last_updated(_index),
+            "template": {"name": TEMPLATES[_index % len(TEMPLATES)]}, "orgGroup": {"name": "Global"},
+            "createdBy": {"name": "Creator"}, "status": STATUSES[_index % len(STATUSES)], "residualRiskScore": _index % 5,
+            "approvers": [{"approver": {"fullName": "Approver"}, "approvedOn": self.last_updated(_index), "resultName": "Approved"}],
+            "respondents": [{"name": "Respondent"}], "respondent": {"name": "Respondent"},
+            "sections": [
+                {"header": {"name": "General", "description": "General questions", "sequence": 1}, "questions": [title] + questions[:half]},
+                {"header": {"name": "Frequently Asked Questions", "sequence": 2}, "questions": [{"question": {"content": "FAQ", "sequence": 1}}]},
+                {"header": {"name": "Details", "description": "Detailed questions", "sequence": 3}, "questions": questions[half:]}
+            ]
+        }
+
+
+class MockConfig(object):
+
+    def __init__(self, _tenant, _page_size=2000, _latency_ms=0.0, _latency_dist="fixed", _export_latency_ms=None,
+                 _rate_429=0.0, _rate_5xx=0.0, _retry_after=1, _max_rps=0.0, _seed=0):
+        self.tenant = _tenant
+        self.page_size = _page_size
+        self.latency_ms = _latency_ms
+        self.export_latency_ms = _latency_ms if _export_latency_ms is None else _export_latency_ms
+        self.latency_dist = _latency_dist
+        self.rate_429 = _rate_429
+        self.rate_5xx = _rate_5xx
+        self.retry_after = _retry_after
+        self.max_rps = _max_rps
+        self.rng = random.Random(_seed)
+        self.lock = threading.Lock()
+        self.tokens = _max_rps
+        self.refilled = time.monotonic()
+        self.stats = {"list_calls": 0, "export_calls": 0, "status_200": 0, "status_429": 0, "status_5xx": 0, "status_4xx": 0, "bytes_sent": 0}
+
+    def latency(self, _mean_ms):
+        if _mean_ms <= 0:
+            return 0.0
+        with self.lock:
+            if self.latency_dist == "uniform":
+                ms = self.rng.uniform(0, 2 * _mean_ms)
+            elif self.latency_dist == "exponential":
+                ms = self.rng.expovariate(1.0 / _mean_ms)
+            elif self.latency_dist == "lognormal":
+                # Median of half the mean with a long tail, as seen on busy tenants
+                ms = self.rng.lognormvariate(0, 1.1) * _mean_ms / 1.83
+            else:
+                ms = _mean_ms
+        return ms / 1000.0
+
+    def injected_status(self):
+        with self.lock:
+            if self.max_rps > 0:
+                now = time.monotonic()
+                self.tokens = min(self.max_rps, self.tokens + (now - self.refilled) * self.max_rps)
+                self.refilled = now
+                if self.tokens < 1:
+                    return 429
+                self.tokens -= 1
+            draw = self.rng.random()
+            if draw < self.rate_429:
+                return 429
+            if draw < self.rate_429 + self.rate_5xx:
+                return self.rng.choice((500, 502, 503, 504))
+        return None
+
+    def count(self, _key, _bytes=0):
+        with self.lock:
+            self.stats[_key] += 1
+            self.stats["bytes_sent"] += _bytes
+
+
+class MockApiHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+    config = None
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, _status, _body=b"", _headers=()):
+        reason = self.responses.get(_status, ("",))[0]
+        head = [f"HTTP/1.1 {_status} {reason}", "Content-Type: application/json", f"Content-Length: {len(_body)}"]
+        head.extend(f"{name}: {value}" for name, value in _headers)
+        # Headers and body in a single write, so that keep-alive clients are not delayed by Nagle
+        self.wfile.write(("\r\n".join(head) + "\r\n\r\n").encode("ascii") + _body)
+        status_key = "status_200" if _status == 200 else "status_429" if _status == 429 else "status_5xx" if _status >= 500 else "status_4xx"
+        self.config.count(status_key, len(_body))
+
+    def do_GET(self):
+        config = self.config
+        url = urlsplit(self.path)
+
+        if url.path == "/__stats":
+            with config.lock:
+                body = json.dumps(config.stats).encode("utf-8")
+            self.wfile.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body))
+            return
+
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            self.send(401, b'{"error": "unauthorized"}')
+            return
+
+        export = EXPORT_PATH.match(url.path)
+        if export:
+            config.count("export_calls")
+            time.sleep(config.latency(config.export_latency_ms))
+        elif url.path == LIST_PATH:
+            config.count("list_calls")
+            time.sleep(config.latency(config.latency_ms))
+        else:
+            self.send(404, b'{"error": "not found"}')
+            return
+
+        status = config.injected_status()
+        if status == 429:
+            self.send(429, b'{"error": "too many requests"}', [("Retry-After", str(config.retry_after))])
+            return
+        if status is not None:
+            self.send(status, b'{"error": "server error"}')
+            return
+
+        if export:
+            index = config.tenant.index_of(export.group(1))
+            if index is None:
+                self.send(404, b'{"error": "assessment not found"}')
+                return
+            body = config.tenant.export(index)
+        else:
+            query = parse_qs(url.query)
+            page = int(query.get("page", ["0"])[0])
+            size = min(int(query.get("size", [str(config.page_size)])[0]), config.page_size)
+            body = config.tenant.page(page, size)
+        self.send(200, json.dumps(body).encode("utf-8"))
+
+
+def start_mock_server(_config, _port=0):
+    """Starts the mock API on a daemon thread and returns the server, whose server_port is bound."""
+    handler = type("BoundMockApiHandler", (MockApiHandler,), {"config": _config})
+    server = ThreadingHTTPServer(("127.0.0.1", _port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="mock-onetrust-api", daemon=True)
+    thread.start()
+    return server
+
+
+def add_mock_arguments(_parser):
+    _parser.add_argument("--page-size", type=int, default=2000, help="largest page returned, whatever size is requested")
+    _parser.add_argument("--questions", type=int, default=20, help="questions per export payload")
+    _parser.add_argument("--response-bytes", type=int, default=64, help="characters per question response")
+    _parser.add_argument("--latency-ms", type=float, default=0.0, help="mean latency of Assessment Summary pages")
+    _parser.add_argument("--export-latency-ms", type=float, default=None, help="mean latency of exports, defaults to --latency-ms")
+    _parser.add_argument("--latency-dist", choices=("fixed", "uniform", "exponential", "lognormal"), default="fixed")
+    _parser.add_argument("--rate-429", type=float, default=0.0, help="share of requests answered 429")
+    _parser.add_argument("--rate-5xx", type=float, default=0.0, help="share of requests answered 500/502/503/504")
+    _parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds of 429 responses")
+    _parser.add_argument("--max-rps", type=float, default=0.0, help="requests per second above which 429 is returned, 0 for no limit")
+    _parser.add_argument("--seed", type=int, default=0)
+
+
+def mock_config(_args, _assessments):
+    tenant = MockTenant(_assessments, _args.questions, _args.response_bytes, _args.seed)
+    return MockConfig(tenant, _args.page_size, _args.latency_ms, _args.latency_dist, _args.export_latency_ms,
+                      _args.rate_429, _args.rate_5xx, _args.retry_after, _args.max_rps, _args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--assessments", type=int, default=10000, help="tenant size")
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    server = start_mock_server(mock_config(args, args.assessments), args.port)
+    print(f"Mock OneTrust API serving {args.assessments} assessments on http://127.0.0.1:{server.server_port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()